@@ -0,0 +1,85 @@
+from .attacks import iter_squares, piece_attacks, rook_attacks, bishop_attacks
+
+
+"""
+
+Attack map: the squares every piece attacks and, per color, how many pieces
+attack each square.
+
+    attacks[square] -> squares attacked by the piece on square (0 when empty)
+    counts[color][square] -> number of pieces of color attacking square
+    attacked[color] -> squares attacked by color at least once
+
+A piece being put down or lifted only changes its own attack set and those of
+the sliders whose rays run through its square, which are found by looking
+along the rook and bishop rays from that square, so is_attacked is a single
+lookup and nothing is rescanned.
+
+"""
+
+
+class AttackMap:
+    """
+    Attacked squares of one board, kept up to date square by square
+    """
+    def __init__(self):
+        self.attacks = [0] * 64
+        self.colors = [None] * 64
+        self.counts = {
+            'W': [0] * 64,
+            'B': [0] * 64
+        }
+        self.attacked = {
+            'W': 0,
+            'B': 0
+        }
+
+    def copy(self):
+        new_map = AttackMap.__new__(AttackMap)
+        new_map.attacks = self.attacks.copy()
+        new_map.colors = self.colors.copy()
+        new_map.counts = {
+            'W': self.counts['W'].copy(),
+            'B': self.counts['B'].copy()
+        }
+        new_map.attacked = self.attacked.copy()
+        return new_map
+
+    def is_attacked(self, square, by_color):
+        return self.counts[by_color][square] > 0
+
+    def _set(self, square, color, attacks):
+        old = self.attacks[square]
+        counts = self.counts[color]
+        attacked = self.attacked[color]
+        for target in iter_squares(old & ~attacks):
+            counts[target] -= 1
+            if not counts[target]:
+                attacked ^= 1 << target
+        for target in iter_squares(attacks & ~old):
+            counts[target] += 1
+            if counts[target] == 1:
+                attacked |= 1 << target
+        self.attacked[color] = attacked
+        self.attacks[square] = attacks
+
+    def update(self, pieces, occupied, square, color=None, name=None):
+        """
+        Called once pieces (color -> piece name -> bitboard) and occupied (both colors) have the piece of color and
+        name put down on square, or the piece on square lifted when name is None
+        """
+        if name is None:
+            self._set(square, self.colors[square], 0)
+            self.colors[square] = None
+        else:
+            self.colors[square] = color
+            self._set(square, color, piece_attacks(color, name, square, occupied))
+
+        # Sliders that see square, their rays now stop there or run on past it
+        rays = rook_attacks(square, occupied), bishop_attacks(square, occupied)
+        for slider_color, own in pieces.items():
+            sliders = (rays[0] & (own['R'] | own['Q'])) | (rays[1] & (own['B'] | own['Q']))
+            for slider in iter_squares(sliders):
+                bit = 1 << slider
+                slider_name = 'R' if own['R'] & bit else 'B' if own['B'] & bit else 'Q'
+                self._set(slider, slider_color, piece_attacks(slider_color, slider_name, slider, occupied))
@@ -0,0 +1,178 @@
+"""
+
+Attack tables, built once at import.
+
+Squares are numbered A1 = 0 .. H8 = 63 (see Position.square) and every set of
+squares is a 64 bit int with bit n set for square n.
+
+Sliding pieces use the magic bitboard layout: for each square only the
+blockers on the relevant rays (board edges excluded) decide the attack set, so
+the table for a square is indexed by `occupied & mask`. Python ints make the
+magic multiply-and-shift slower than hashing the masked occupancy directly,
+so each square's table is a dict keyed on the masked occupancy, the PEXT
+variant of the same idea.
+
+"""
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_B = FILE_A << 1
+FILE_G = FILE_A << 6
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+NOT_A = FULL ^ FILE_A
+NOT_H = FULL ^ FILE_H
+NOT_AB = FULL ^ (FILE_A | FILE_B)
+NOT_GH = FULL ^ (FILE_G | FILE_H)
+
+# (shift, mask applied after shifting) for every sliding direction
+ROOK_DIRECTIONS = ((8, FULL), (-8, FULL), (1, NOT_A), (-1, NOT_H))
+BISHOP_DIRECTIONS = ((9, NOT_A), (7, NOT_H), (-7, NOT_A), (-9, NOT_H))
+
+
+def iter_squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _shift(bb, shift):
+    if shift > 0:
+        return (bb << shift) & FULL
+    return bb >> -shift
+
+
+def _ray_attacks(bb, shift, mask, empty):
+    attacks = 0
+    bb = _shift(bb, shift) & mask
+    while bb:
+        attacks |= bb
+        bb = _shift(bb & empty, shift) & mask
+    return attacks
+
+
+def _slider_attacks(square, occupied, rays):
+    # Classical ray lookup: cut every ray behind its nearest blocker
+    attacks = 0
+    for shift, ray_table in rays:
+        ray = ray_table[square]
+        blockers = ray & occupied
+        if blockers:
+            if shift > 0:
+                nearest = (blockers & -blockers).bit_length() - 1
+            else:
+                nearest = blockers.bit_length() - 1
+            ray ^= ray_table[nearest]
+        attacks |= ray
+    return attacks
+
+
+def _rays(directions):
+    return [(shift, [_ray_attacks(1 << square, shift, mask, FULL) for square in range(64)])
+            for shift, mask in directions]
+
+
+def _relevant_mask(square, directions):
+    # A blocker on the last square of a ray never changes the attack set
+    mask = 0
+    for shift, step_mask in directions:
+        ray = _ray_attacks(1 << square, shift, step_mask, FULL)
+        mask |= ray & ~_ray_end(ray, shift)
+    return mask
+
+
+def _ray_end(ray, shift):
+    if not ray:
+        return 0
+    if shift > 0:
+        return 1 << (ray.bit_length() - 1)
+    return ray & -ray
+
+
+def _subsets(mask):
+    # Carry-rippler enumeration of every subset of mask
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0:
+            break
+
+
+def _build_slider_table(directions):
+    rays = _rays(directions)
+    masks = []
+    tables = []
+    for square in range(64):
+        mask = _relevant_mask(square, directions)
+        masks.append(mask)
+        tables.append({occupied: _slider_attacks(square, occupied, rays) for occupied in _subsets(mask)})
+    return masks, tables
+
+
+def _knight_attacks(bb):
+    return (((bb << 17) & NOT_A) | ((bb << 15) & NOT_H) | ((bb << 10) & NOT_AB) | ((bb << 6) & NOT_GH) |
+            ((bb >> 17) & NOT_H) | ((bb >> 15) & NOT_A) | ((bb >> 10) & NOT_GH) | ((bb >> 6) & NOT_AB)) & FULL
+
+
+def _king_attacks(bb):
+    attacks = ((bb << 1) & NOT_A) | ((bb >> 1) & NOT_H)
+    bb |= attacks
+    return (attacks | (bb << 8) | (bb >> 8)) & FULL
+
+
+def _pawn_attacks(bb, color):
+    if color == 'W':
+        return (((bb << 9) & NOT_A) | ((bb << 7) & NOT_H)) & FULL
+    return ((bb >> 7) & NOT_A) | ((bb >> 9) & NOT_H)
+
+
+KNIGHT_ATTACKS = [_knight_attacks(1 << square) for square in range(64)]
+KING_ATTACKS = [_king_attacks(1 << square) for square in range(64)]
+PAWN_ATTACKS = {
+    'W': [_pawn_attacks(1 << square, 'W') for square in range(64)],
+    'B': [_pawn_attacks(1 << square, 'B') for square in range(64)]
+}
+
+ROOK_MASKS, ROOK_TABLES = _build_slider_table(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _build_slider_table(BISHOP_DIRECTIONS)
+
+
+def rook_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+
+
+def bishop_attacks(square, occupied):
+    return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def queen_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]] | BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def _between(a, b):
+    for attacks in (rook_attacks, bishop_attacks):
+        if attacks(a, 0) & (1 << b):
+            return attacks(a, 1 << b) & attacks(b, 1 << a)
+    return 0
+
+
+# Squares strictly between two squares on a shared rank, file or diagonal, 0 when they are not aligned
+BETWEEN = [[_between(a, b) for b in range(64)] for a in range(64)]
+
+
+def piece_attacks(color, name, square, occupied):
+    # Squares attacked by the piece, own pieces included
+    if name == 'P':
+        return PAWN_ATTACKS[color][square]
+    if name == 'N':
+        return KNIGHT_ATTACKS[square]
+    if name == 'B':
+        return bishop_attacks(square, occupied)
+    if name == 'R':
+        return rook_attacks(square, occupied)
+    if name == 'Q':
+        return queen_attacks(square, occupied)
+    return KING_ATTACKS[square]
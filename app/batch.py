@@ -0,0 +1,258 @@
+from collections import namedtuple
+import numpy as np
+from .attacks import FILE_A, FILE_H, RANK_1, RANK_8
+from .encoding import PIECE_INDEX
+from .evaluation import MG_TERMS, EG_TERMS, PHASE_WEIGHTS, MAX_PHASE
+from .rules import CASTLING_RIGHTS, CASTLING_MOVES, CASTLING_ROOK_SQUARES
+
+
+"""
+
+Many boards at once: move counts, attacked squares and evaluation of N
+positions in NumPy array operations, for self-play data and analysis where
+positions come by the thousand and searching any one of them is not needed.
+
+A batch holds the bitboards of every board, pieces[n, color, piece] with
+colors in 'WB' order and pieces in app.encoding's 'PNBRQK' order, plus the
+side to move, castling rights and en-passant square of each. Everything below
+works set-wise on whole bitboards, shifting and masking all N boards per
+step, the Kogge-Stone fill standing in for the attack tables of app.attacks:
+
+    attack_masks(batch)        -> (N, 2) squares attacked by white and black
+    legal_move_counts(batch)   -> (N,) legal moves for the side to move
+    evaluate(batch)            -> (N,) tapered score of app.evaluation
+
+Python only loops over piece slots, at most ten per piece type, never over
+boards.
+
+"""
+
+COLORS = 'WB'
+
+# pieces: (N, 2, 6) uint64, side_to_move: (N,) 0 white / 1 black, castling: (N,) bits in CASTLING_RIGHTS order,
+# en_passant: (N,) square or -1
+BoardBatch = namedtuple('BoardBatch', ['pieces', 'side_to_move', 'castling', 'en_passant'])
+
+_P, _N, _B, _R, _Q, _K = range(6)
+
+_ZERO = np.uint64(0)
+_FULL = np.uint64(0xFFFFFFFFFFFFFFFF)
+_NOT_A = np.uint64(0xFFFFFFFFFFFFFFFF ^ FILE_A)
+_NOT_H = np.uint64(0xFFFFFFFFFFFFFFFF ^ FILE_H)
+_NOT_AB = np.uint64(0xFFFFFFFFFFFFFFFF ^ (FILE_A | FILE_A << 1))
+_NOT_GH = np.uint64(0xFFFFFFFFFFFFFFFF ^ (FILE_H | FILE_H >> 1))
+_RANK_3 = np.uint64(RANK_1 << 16)
+_RANK_6 = np.uint64(RANK_1 << 40)
+_LAST_RANK = np.array([RANK_8, RANK_1], dtype=np.uint64)
+
+# (shift, mask applied after shifting), the directions of app.attacks
+_ROOK_DIRECTIONS = ((8, _FULL), (-8, _FULL), (1, _NOT_A), (-1, _NOT_H))
+_BISHOP_DIRECTIONS = ((9, _NOT_A), (7, _NOT_H), (-7, _NOT_A), (-9, _NOT_H))
+
+_MG = np.array([[MG_TERMS[color][name] for name in PIECE_INDEX] for color in COLORS], dtype=np.int64)
+_EG = np.array([[EG_TERMS[color][name] for name in PIECE_INDEX] for color in COLORS], dtype=np.int64)
+_PHASE = np.array([PHASE_WEIGHTS[name] for name in PIECE_INDEX], dtype=np.int64)
+
+
+def pack(boards):
+    """
+    BoardBatch of any boards keeping the bitboard view (board.pieces, castling_rights, en_passant)
+    """
+    n = len(boards)
+    pieces = np.zeros((n, 2, 6), dtype=np.uint64)
+    side_to_move = np.zeros(n, dtype=np.int8)
+    castling = np.zeros(n, dtype=np.uint8)
+    en_passant = np.full(n, -1, dtype=np.int8)
+    for index, board in enumerate(boards):
+        pieces[index] = [[board.pieces[color][name] for name in PIECE_INDEX] for color in COLORS]
+        side_to_move[index] = board.side_to_move == 'B'
+        castling[index] = sum(1 << bit for bit, right in enumerate(CASTLING_RIGHTS) if right in board.castling_rights)
+        if board.en_passant is not None:
+            en_passant[index] = board.en_passant.square
+    return BoardBatch(pieces=pieces, side_to_move=side_to_move, castling=castling, en_passant=en_passant)
+
+
+def _shift(bb, shift):
+    if shift > 0:
+        return bb << np.uint64(shift)
+    return bb >> np.uint64(-shift)
+
+
+def _popcount(bb):
+    bb = bb - ((bb >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    bb = (bb & np.uint64(0x3333333333333333)) + ((bb >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    bb = (bb + (bb >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((bb * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def _lsb(bb):
+    return bb & (~bb + np.uint64(1))
+
+
+def _ray(sliders, empty, shift, mask):
+    # Kogge-Stone fill: every square the sliders reach in one direction, the first blocker included
+    propagate = empty & mask
+    sliders = sliders | (propagate & _shift(sliders, shift))
+    propagate = propagate & _shift(propagate, shift)
+    sliders = sliders | (propagate & _shift(sliders, 2 * shift))
+    propagate = propagate & _shift(propagate, 2 * shift)
+    sliders = sliders | (propagate & _shift(sliders, 4 * shift))
+    return _shift(sliders, shift) & mask
+
+
+def _slider_attacks(sliders, empty, directions):
+    attacks = np.zeros_like(sliders)
+    for shift, mask in directions:
+        attacks |= _ray(sliders, empty, shift, mask)
+    return attacks
+
+
+def _knight_attacks(bb):
+    return (((bb << np.uint64(17)) & _NOT_A) | ((bb << np.uint64(15)) & _NOT_H) |
+            ((bb << np.uint64(10)) & _NOT_AB) | ((bb << np.uint64(6)) & _NOT_GH) |
+            ((bb >> np.uint64(17)) & _NOT_H) | ((bb >> np.uint64(15)) & _NOT_A) |
+            ((bb >> np.uint64(10)) & _NOT_GH) | ((bb >> np.uint64(6)) & _NOT_AB))
+
+
+def _king_attacks(bb):
+    attacks = ((bb << np.uint64(1)) & _NOT_A) | ((bb >> np.uint64(1)) & _NOT_H)
+    bb = bb | attacks
+    return attacks | (bb << np.uint64(8)) | (bb >> np.uint64(8))
+
+
+def _pawn_attacks(bb, white):
+    # white: (N,) bool, the color of the pawns of each board
+    up = ((bb << np.uint64(9)) & _NOT_A) | ((bb << np.uint64(7)) & _NOT_H)
+    down = ((bb >> np.uint64(7)) & _NOT_A) | ((bb >> np.uint64(9)) & _NOT_H)
+    return np.where(white, up, down)
+
+
+def _attacks(pieces, white, empty):
+    # Squares attacked by the (N, 6) pieces of one side
+    rooks = pieces[:, _R] | pieces[:, _Q]
+    bishops = pieces[:, _B] | pieces[:, _Q]
+    return _pawn_attacks(pieces[:, _P], white) | _knight_attacks(pieces[:, _N]) | _king_attacks(pieces[:, _K]) | \
+        _slider_attacks(rooks, empty, _ROOK_DIRECTIONS) | _slider_attacks(bishops, empty, _BISHOP_DIRECTIONS)
+
+
+def attack_masks(batch):
+    """
+    (N, 2) squares attacked by white and by black on every board, own pieces included
+    """
+    pieces = batch.pieces
+    empty = ~np.bitwise_or.reduce(pieces, axis=(1, 2))
+    white = np.ones(len(pieces), dtype=bool)
+    return np.stack([_attacks(pieces[:, 0], white, empty), _attacks(pieces[:, 1], ~white, empty)], axis=1)
+
+
+def legal_move_counts(batch):
+    """
+    (N,) number of legal moves for the side to move of every board, counting every promotion piece, the same
+    moves app.movegen.generate_legal_moves lists
+    """
+    n = len(batch.pieces)
+    rows = np.arange(n)
+    stm = batch.side_to_move.astype(np.intp)
+    white = stm == 0
+    own = batch.pieces[rows, stm]
+    enemy = batch.pieces[rows, 1 - stm]
+    us = np.bitwise_or.reduce(own, axis=1)
+    them = np.bitwise_or.reduce(enemy, axis=1)
+    occupied = us | them
+    empty = ~occupied
+    king = own[:, _K]
+    enemy_rooks = enemy[:, _R] | enemy[:, _Q]
+    enemy_bishops = enemy[:, _B] | enemy[:, _Q]
+
+    # Per direction from the king: the ray up to the first piece of any color, and the one up to the first enemy
+    # piece, looking through own pieces. The first gives check rays, the second pin rays.
+    checkers = (_knight_attacks(king) & enemy[:, _N]) | (_pawn_attacks(king, white) & enemy[:, _P])
+    check_rays = np.zeros(n, dtype=np.uint64)
+    pinned = []
+    for directions, sliders in ((_ROOK_DIRECTIONS, enemy_rooks), (_BISHOP_DIRECTIONS, enemy_bishops)):
+        for shift, mask in directions:
+            ray = _ray(king, empty, shift, mask)
+            checker = ray & sliders
+            checkers |= checker
+            check_rays |= np.where(checker != _ZERO, ray, _ZERO)
+
+            ray = _ray(king, ~them, shift, mask)
+            blockers = ray & us
+            single = (blockers != _ZERO) & ((blockers & (blockers - np.uint64(1))) == _ZERO)
+            pinned.append((np.where(single & ((ray & sliders) != _ZERO), blockers, _ZERO), ray))
+
+    n_checkers = _popcount(checkers)
+    check_mask = np.where(n_checkers == 0, _FULL, checkers | check_rays)
+    # Double check: only the king may move
+    check_mask = np.where(n_checkers > 1, _ZERO, check_mask)
+
+    def pin_mask(piece):
+        mask = np.full(n, _FULL)
+        for pinned_piece, ray in pinned:
+            mask = np.where((piece & pinned_piece) != _ZERO, ray, mask)
+        return mask
+
+    # The king itself must not shadow the squares behind it from a slider checking it
+    danger = _attacks(enemy, ~white, empty | king)
+    counts = _popcount(_king_attacks(king) & ~us & ~danger)
+
+    for bit, right in enumerate(CASTLING_RIGHTS):
+        king_from, king_to, must_be_empty, path = CASTLING_MOVES[right]
+        rook_from = CASTLING_ROOK_SQUARES[king_to][0]
+        path_mask = np.uint64(sum(1 << square for square in path))
+        counts += ((batch.castling & (1 << bit)) != 0) & (white == right.isupper()) & (n_checkers == 0) & \
+            ((king & np.uint64(1 << king_from)) != _ZERO) & ((own[:, _R] & np.uint64(1 << rook_from)) != _ZERO) & \
+            ((occupied & np.uint64(must_be_empty)) == _ZERO) & ((danger & path_mask) == _ZERO)
+
+    def each_piece(bb):
+        # One piece of every board per step, lowest square first, 0 for boards that ran out
+        while (bb != _ZERO).any():
+            piece = _lsb(bb)
+            bb = bb ^ piece
+            yield piece
+
+    for index, attacks in ((_N, _knight_attacks),
+                           (_B, lambda bb: _slider_attacks(bb, empty, _BISHOP_DIRECTIONS)),
+                           (_R, lambda bb: _slider_attacks(bb, empty, _ROOK_DIRECTIONS)),
+                           (_Q, lambda bb: _slider_attacks(bb, empty, _ROOK_DIRECTIONS + _BISHOP_DIRECTIONS))):
+        for piece in each_piece(own[:, index]):
+            counts += _popcount(attacks(piece) & ~us & check_mask & pin_mask(piece))
+
+    last_rank = _LAST_RANK[stm]
+    has_en_passant = batch.en_passant >= 0
+    en_passant = np.where(has_en_passant, np.uint64(1) << batch.en_passant.clip(0).astype(np.uint64), _ZERO)
+    captured = np.where(white, en_passant >> np.uint64(8), en_passant << np.uint64(8))
+    for piece in each_piece(own[:, _P]):
+        pin = pin_mask(piece)
+        attacks = _pawn_attacks(piece, white)
+        one = np.where(white, piece << np.uint64(8), piece >> np.uint64(8)) & empty
+        two = np.where(white, (one & _RANK_3) << np.uint64(8), (one & _RANK_6) >> np.uint64(8)) & empty
+        targets = ((attacks & them) | one | two) & check_mask & pin
+        counts += _popcount(targets & ~last_rank) + 4 * _popcount(targets & last_rank)
+
+        # Two pawns leave the same rank at once, so test the resulting position for slider attacks on the king.
+        # Also legal when the pawn taken en passant is the one giving check
+        after = (occupied ^ piece ^ captured) | en_passant
+        counts += ((attacks & en_passant & pin) != _ZERO) & ((check_mask & (en_passant | captured)) != _ZERO) & \
+            ((_slider_attacks(king, ~after, _ROOK_DIRECTIONS) & enemy_rooks) == _ZERO) & \
+            ((_slider_attacks(king, ~after, _BISHOP_DIRECTIONS) & enemy_bishops) == _ZERO)
+
+    # Boards without a king of the side to move have no moves, as in app.movegen
+    return np.where(king == _ZERO, 0, counts)
+
+
+def evaluate(batch, player=None):
+    """
+    (N,) tapered scores of app.evaluation, from player's point of view, each board's side to move by default
+    """
+    bits = np.unpackbits(np.ascontiguousarray(batch.pieces).view(np.uint8), axis=-1, bitorder='little')
+    bits = bits.reshape(len(batch.pieces), 2, 6, 64).astype(np.int64)
+    mg = np.einsum('ncps,cps->n', bits, _MG)
+    eg = np.einsum('ncps,cps->n', bits, _EG)
+    phase = np.minimum(np.einsum('ncps,p->n', bits, _PHASE), MAX_PHASE)
+    score = (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+    if player is None:
+        black = batch.side_to_move == 1
+    else:
+        black = player == 'B'
+    return np.where(black, -score, score)
@@ -0,0 +1,198 @@
+import argparse
+import json
+import time
+from .chess import ChessGame, PLAIN_SEARCH
+from .board import Board
+
+
+"""
+
+Search benchmark: runs ChessGame.get_best_move over a fixed suite of
+positions, at a fixed depth or a fixed time per position, and reports
+
+    nodes, nps, time to each depth, effective branching factor, TT hit rate, solve rate
+
+as JSON. A saved run can serve as the baseline of a later one:
+
+    python -m app.bench --depth 3 --output baseline.json
+    python -m app.bench --depth 3 --baseline baseline.json --tolerance 0.1
+
+which exits with 1 when a summary metric got worse by more than the
+tolerance.
+
+--plain runs plain full-window alpha-beta, without PVS, null moves or late
+move reductions, to weigh them against.
+
+"""
+
+# (id, fen, best moves in coordinate notation)
+SUITE = [
+    ('back-rank-mate', '6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1', ['a1a8']),
+    ('back-rank-mate-black', 'r5k1/8/8/8/8/8/5PPP/6K1 b - - 0 1', ['a8a1']),
+    ('hanging-queen', '4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1', ['d2d5']),
+    ('queen-for-rook', '3rk3/8/8/8/8/8/8/3QK3 b - - 0 1', ['d8d1']),
+    ('knight-fork', 'q3k3/8/8/1N6/8/8/8/4K3 w - - 0 1', ['b5c7']),
+    ('pawn-fork', '4k3/8/8/2r1r3/8/3P4/8/6K1 w - - 0 1', ['d3d4']),
+    ('capture-promotion', '3r4/4P3/8/8/8/8/k7/4K3 w - - 0 1', ['e7d8']),
+]
+
+# Summary metrics and whether a higher value is better
+METRICS = {
+    'nodes': False,
+    'seconds': False,
+    'nps': True,
+    'ebf': False,
+    'tt_hit_rate': True,
+    'solve_rate': True,
+}
+
+
+def load_epd(path):
+    """
+    Suite from an EPD file whose bm operations are in coordinate notation: <fen fields> bm e2e4 d2d4; id "name";
+    """
+    suite = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split(maxsplit=4)
+            operations = {}
+            for operation in fields[4].split(';') if len(fields) > 4 else []:
+                if operation.strip():
+                    opcode, _, operand = operation.strip().partition(' ')
+                    operations[opcode] = operand.strip().strip('"')
+            fen = ' '.join(fields[:4]) + ' 0 1'
+            suite.append((operations.get('id', str(number)), fen, operations.get('bm', '').split()))
+    return suite
+
+
+def _effective_branching_factor(depth_nodes):
+    # Nodes of the last completed iteration over those of the one before
+    iteration_nodes = [nodes - previous for nodes, previous in zip(depth_nodes, [0] + depth_nodes[:-1])]
+    if len(iteration_nodes) < 2 or not iteration_nodes[-2]:
+        return None
+    return iteration_nodes[-1] / iteration_nodes[-2]
+
+
+def run_position(game, name, fen, best_moves, depth=None, max_time=None):
+    board = Board.from_fen(fen)
+    start_time = time.time()
+    if depth is not None:
+        result = game.search(board, board.side_to_move, 1e9, depth, depth)
+    else:
+        result = game.search(board, board.side_to_move, max_time, 50, 1)
+    seconds = time.time() - start_time
+
+    stats = result.stats
+    piece, move_position = result.move
+    move = None if piece is None else f"{piece.position}{move_position}".lower()
+    nodes = stats.total_nodes
+    report = {
+        'id': name,
+        'move': move,
+        'score': result.score,
+        'solved': move in best_moves,
+        'depth': stats.depth,
+        'nodes': nodes,
+        'seconds': seconds,
+        'nps': nodes / seconds if seconds > 0 else 0.,
+        'time_to_depth': stats.depth_times,
+        'ebf': _effective_branching_factor(stats.depth_nodes),
+        'tt_hit_rate': stats.tt_hit_rate,
+        'tt_cutoffs': stats['tt_cutoffs'],
+        'null_cutoffs': stats['null_cutoffs'],
+        # Share of beta cutoffs made by the first move searched, how good move ordering is
+        'first_move_cutoff_rate': stats['cutoff_index'][0] / stats['beta_cutoffs'] if stats['beta_cutoffs'] else None,
+    }
+    if game.profile:
+        report.update(movegen_time=stats['movegen_time'], evaluation_time=stats['evaluation_time'])
+    return report
+
+
+def run_suite(suite=SUITE, depth=None, max_time=None, workers=None, tt_size_mb=16, search_options=None,
+              profile=False):
+    """
+    Searches every (id, fen, best moves) of suite, to depth plies or for max_time seconds each, and returns the
+    JSON-ready report
+    """
+    with ChessGame(Board(), tt_size_mb=tt_size_mb, workers=workers, search_options=search_options,
+                   profile=profile) as game:
+        positions = [run_position(game, name, fen, best_moves, depth, max_time) for name, fen, best_moves in suite]
+
+    nodes = sum(position['nodes'] for position in positions)
+    seconds = sum(position['seconds'] for position in positions)
+    branching_factors = [position['ebf'] for position in positions if position['ebf'] is not None]
+    return {
+        'config': {'depth': depth, 'max_time': max_time, 'workers': game.workers, 'tt_size_mb': tt_size_mb,
+                   'search_options': game.search_options._asdict(), 'profile': profile},
+        'summary': {
+            'nodes': nodes,
+            'seconds': seconds,
+            'nps': nodes / seconds if seconds > 0 else 0.,
+            'ebf': sum(branching_factors) / len(branching_factors) if branching_factors else None,
+            'tt_hit_rate': sum(position['tt_hit_rate'] for position in positions) / len(positions),
+            'solve_rate': sum(position['solved'] for position in positions) / len(positions),
+        },
+        'positions': positions,
+    }
+
+
+def compare(report, baseline, tolerance=0.1):
+    """
+    Summary metrics of report that are worse than in baseline by more than tolerance (a fraction of the baseline
+    value), as {metric: (baseline value, value)}
+    """
+    regressions = {}
+    for metric, higher_is_better in METRICS.items():
+        expected = baseline['summary'].get(metric)
+        value = report['summary'].get(metric)
+        if expected is None or value is None:
+            continue
+        if higher_is_better:
+            worse = value < expected - abs(expected) * tolerance
+        else:
+            worse = value > expected + abs(expected) * tolerance
+        if worse:
+            regressions[metric] = expected, value
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.bench', description='Search benchmark')
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument('--depth', type=int, help='fixed depth per position (default 3)')
+    limit.add_argument('--time', type=float, help='fixed seconds per position')
+    parser.add_argument('--epd', help='suite to run instead of the built-in one')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--tt-size-mb', type=int, default=16)
+    parser.add_argument('--plain', action='store_true', help='plain alpha-beta, no PVS, null moves or reductions')
+    parser.add_argument('--profile', action='store_true', help='time move generation and evaluation')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--baseline', help='report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    depth = args.depth if args.depth is not None or args.time is not None else 3
+    suite = load_epd(args.epd) if args.epd else SUITE
+    report = run_suite(suite, depth, args.time, args.workers, args.tt_size_mb,
+                       PLAIN_SEARCH if args.plain else None, args.profile)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for metric, (expected, value) in regressions.items():
+            print(f"regression: {metric} {expected} -> {value}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+from .piece import Pieces as p
+from .position import Position
+from .attacks import FULL, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, \
+    piece_attacks, iter_squares
+from .rules import CASTLING_RIGHTS, CASTLING_ROOK_SQUARES, update_castling_rights, en_passant_square, is_castling, \
+    is_promotion
+from .zobrist import PIECE_KEYS, SIDE_KEY, castling_key, en_passant_key, compute_key
+from .fen import parse_fen, format_fen, board_fields, load_fields
+from .encoding import encode_fields, decode_fields
+from .evaluation import MG_TERMS, EG_TERMS, PHASE_WEIGHTS, compute_terms
+
+
+"""
+
+bitboard -> {
+    color -> {
+        piece name -> 64 bit int, bit n set when square n (A1 = 0, H8 = 63) holds that piece
+    }
+}
+
+"""
+
+PIECE_NAMES = 'PNBRQK'
+
+START_POSITION = {
+    'W': {'P': 0xFF00, 'N': 0x42, 'B': 0x24, 'R': 0x81, 'Q': 0x08, 'K': 0x10},
+    'B': {'P': 0xFF << 48, 'N': 0x42 << 56, 'B': 0x24 << 56, 'R': 0x81 << 56, 'Q': 0x08 << 56, 'K': 0x10 << 56},
+}
+
+
+class BitBoard:
+    """
+    A chess board stored as one occupancy integer per color and piece type
+    """
+    def __init__(self, fill=True):
+        self.pieces = {
+            'W': dict.fromkeys(PIECE_NAMES, 0),
+            'B': dict.fromkeys(PIECE_NAMES, 0)
+        }
+        self.occupied = {
+            'W': 0,
+            'B': 0
+        }
+        self.king_in_check = {
+            'W': False,
+            'B': False
+        }
+
+        self.side_to_move = 'W'
+        self.castling_rights = CASTLING_RIGHTS if fill else ''
+        self.en_passant = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.zobrist_key = castling_key(self.castling_rights)
+        # Keys of the positions before this one, see app.draws
+        self.key_history = []
+        # Evaluation sums kept up to date with the pieces, see app.evaluation
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        if fill:
+            self._fill_board()
+
+    def copy(self):
+        new_board = BitBoard(fill=False)
+        new_board.pieces = {
+            'W': self.pieces['W'].copy(),
+            'B': self.pieces['B'].copy()
+        }
+        new_board.occupied = self.occupied.copy()
+        new_board.king_in_check = self.king_in_check.copy()
+        new_board.side_to_move = self.side_to_move
+        new_board.castling_rights = self.castling_rights
+        new_board.en_passant = self.en_passant
+        new_board.halfmove_clock = self.halfmove_clock
+        new_board.fullmove_number = self.fullmove_number
+        new_board.zobrist_key = self.zobrist_key
+        new_board.key_history = self.key_history.copy()
+        new_board.mg_score = self.mg_score
+        new_board.eg_score = self.eg_score
+        new_board.phase = self.phase
+        return new_board
+
+    @classmethod
+    def from_fen(cls, fen):
+        return load_fields(cls, parse_fen(fen))
+
+    def to_fen(self):
+        return format_fen(board_fields(self))
+
+    @classmethod
+    def from_bytes(cls, data):
+        # See app.encoding
+        return load_fields(cls, decode_fields(data))
+
+    def to_bytes(self):
+        return encode_fields(board_fields(self))
+
+    def __hash__(self):
+        return self.zobrist_key
+
+    def __eq__(self, other):
+        return self.zobrist_key == other.zobrist_key
+
+    def compute_zobrist_key(self):
+        # From scratch, zobrist_key itself is kept up to date move by move
+        return compute_key(((color, name, square) for color in 'WB' for name, bb in self.pieces[color].items()
+                            for square in iter_squares(bb)),
+                           self.side_to_move, self.castling_rights, self.en_passant)
+
+    def compute_eval_terms(self):
+        # From scratch, like compute_zobrist_key
+        return compute_terms((color, name, square) for color in 'WB' for name, bb in self.pieces[color].items()
+                             for square in iter_squares(bb))
+
+    def _piece_at(self, square):
+        bit = 1 << square
+        for color in 'WB':
+            if self.occupied[color] & bit:
+                for name, bb in self.pieces[color].items():
+                    if bb & bit:
+                        return color, name
+        return None
+
+    def __getitem__(self, position):
+        found = self._piece_at(position.square)
+        if found is None:
+            return None
+        color, name = found
+        return getattr(p, name)(position=position, color=color)
+
+    def get_piece(self, position):
+        return self[position]
+
+    @property
+    def board(self):
+        # Position -> Piece view for code written against Board
+        board = {}
+        for color in 'WB':
+            for name, bb in self.pieces[color].items():
+                for square in iter_squares(bb):
+                    position = Position.from_square(square)
+                    board[position] = getattr(p, name)(position=position, color=color)
+        return board
+
+    @property
+    def king(self):
+        king = {}
+        for color in 'WB':
+            square = self.king_square(color)
+            king[color] = None if square is None else self[Position.from_square(square)]
+        return king
+
+    def set_piece(self, piece):
+        self._remove(piece.position.square)
+        self._put(piece.color, piece.name, piece.position.square)
+
+    def _put(self, color, name, square):
+        bit = 1 << square
+        self.pieces[color][name] |= bit
+        self.occupied[color] |= bit
+        self.zobrist_key ^= PIECE_KEYS[color][name][square]
+        self.mg_score += MG_TERMS[color][name][square]
+        self.eg_score += EG_TERMS[color][name][square]
+        self.phase += PHASE_WEIGHTS[name]
+
+    def _remove(self, square):
+        found = self._piece_at(square)
+        if found is not None:
+            color, name = found
+            mask = FULL ^ (1 << square)
+            self.pieces[color][name] &= mask
+            self.occupied[color] &= mask
+            self.zobrist_key ^= PIECE_KEYS[color][name][square]
+            self.mg_score -= MG_TERMS[color][name][square]
+            self.eg_score -= EG_TERMS[color][name][square]
+            self.phase -= PHASE_WEIGHTS[name]
+        return found
+
+    def _fill_board(self):
+        for color in 'WB':
+            self.pieces[color] = START_POSITION[color].copy()
+            self.occupied[color] = sum(self.pieces[color].values())
+        self.zobrist_key = self.compute_zobrist_key()
+        self.mg_score, self.eg_score, self.phase = self.compute_eval_terms()
+
+    def king_square(self, color):
+        bb = self.pieces[color]['K']
+        if bb:
+            return bb.bit_length() - 1
+
+    @staticmethod
+    def _invert_color(color):
+        if color == 'W':
+            return 'B'
+        return 'W'
+
+    def is_attacked(self, square, by_color):
+        attacker = self.pieces[by_color]
+        if KNIGHT_ATTACKS[square] & attacker['N']:
+            return True
+        if KING_ATTACKS[square] & attacker['K']:
+            return True
+        if PAWN_ATTACKS[self._invert_color(by_color)][square] & attacker['P']:
+            return True
+        occupied = self.occupied['W'] | self.occupied['B']
+        if rook_attacks(square, occupied) & (attacker['R'] | attacker['Q']):
+            return True
+        return bool(bishop_attacks(square, occupied) & (attacker['B'] | attacker['Q']))
+
+    def _update_king_in_check(self):
+        for color in 'WB':
+            square = self.king_square(color)
+            self.king_in_check[color] = square is not None and self.is_attacked(square, self._invert_color(color))
+
+    def move_piece(self, from_position, to_position, promotion=None):
+        from_square = from_position.square
+        to_square = to_position.square
+        self.key_history.append(self.zobrist_key)
+        color, name = self._remove(from_square)
+        captured = self._remove(to_square)
+        if captured is None and name == 'P' and self.en_passant is not None and to_square == self.en_passant.square:
+            # The pawn taken en passant stands beside the moving pawn
+            self._remove(from_square - from_square % 8 + to_square % 8)
+        if is_castling(name, from_square, to_square):
+            rook_from, rook_to = CASTLING_ROOK_SQUARES[to_square]
+            self._remove(rook_from)
+            self._put(color, 'R', rook_to)
+        self._put(color, (promotion or 'Q') if is_promotion(name, to_square) else name, to_square)
+
+        self.halfmove_clock = 0 if name == 'P' or captured is not None else self.halfmove_clock + 1
+        side_to_move = self._invert_color(color)
+        if side_to_move == 'W':
+            self.fullmove_number += 1
+        if side_to_move != self.side_to_move:
+            self.zobrist_key ^= SIDE_KEY
+            self.side_to_move = side_to_move
+
+        castling_rights = update_castling_rights(self.castling_rights, from_square, to_square)
+        if castling_rights != self.castling_rights:
+            self.zobrist_key ^= castling_key(self.castling_rights) ^ castling_key(castling_rights)
+            self.castling_rights = castling_rights
+
+        self.zobrist_key ^= en_passant_key(self.en_passant)
+        en_passant = en_passant_square(name, from_square, to_square)
+        self.en_passant = None if en_passant is None else Position.from_square(en_passant)
+        self.zobrist_key ^= en_passant_key(self.en_passant)
+
+        self._update_king_in_check()
+
+    def make_move(self, from_position, to_position, promotion=None):
+        # The undo record is the previous set of ints, the move itself works on copies of them
+        undo = (self.pieces, self.occupied, self.king_in_check, self.side_to_move, self.castling_rights,
+                self.en_passant, self.zobrist_key, self.mg_score, self.eg_score, self.phase, self.halfmove_clock,
+                self.fullmove_number)
+        self.pieces = {
+            'W': self.pieces['W'].copy(),
+            'B': self.pieces['B'].copy()
+        }
+        self.occupied = self.occupied.copy()
+        self.king_in_check = self.king_in_check.copy()
+        self.move_piece(from_position, to_position, promotion)
+        return undo
+
+    def unmake_move(self, undo):
+        self.pieces, self.occupied, self.king_in_check, self.side_to_move, self.castling_rights, \
+            self.en_passant, self.zobrist_key, self.mg_score, self.eg_score, self.phase, self.halfmove_clock, \
+            self.fullmove_number = undo
+        self.key_history.pop()
+
+    def make_null_move(self):
+        # Passes the turn, see Board.make_null_move
+        undo = (self.side_to_move, self.en_passant, self.zobrist_key, self.halfmove_clock)
+        self.key_history.append(self.zobrist_key)
+        self.zobrist_key ^= SIDE_KEY ^ en_passant_key(self.en_passant)
+        self.side_to_move = self._invert_color(self.side_to_move)
+        self.en_passant = None
+        self.halfmove_clock = 0
+        return undo
+
+    def unmake_null_move(self, undo):
+        self.side_to_move, self.en_passant, self.zobrist_key, self.halfmove_clock = undo
+        self.key_history.pop()
+
+    def get_attacked_positions(self, color):
+        # Same shape as Board.attacked_positions[color]: opposing piece -> positions it attacks
+        occupied = self.occupied['W'] | self.occupied['B']
+        attacked_positions = {}
+        for square in iter_squares(self.occupied[self._invert_color(color)]):
+            position = Position.from_square(square)
+            piece = self[position]
+            attacks = piece_attacks(piece.color, piece.name, square, occupied)
+            attacked_positions[piece] = {Position.from_square(s) for s in iter_squares(attacks)}
+        return attacked_positions
+
+    def view_board(self):
+        for rank in range(8, 0, -1):
+            for file in 'ABCDEFGH':
+                piece = self[Position(rank=rank, file=file)]
+                if piece is None:
+                    piece = p.E(Position(rank=rank, file=file))
+                print(piece, end=' ')
+            print()
@@ -1,8 +1,18 @@
 import time
 from .piece import Pieces as p
 from .position import Position
+from .rules import CASTLING_RIGHTS, CASTLING_ROOK_SQUARES, update_castling_rights, en_passant_square, is_castling, \
+    is_promotion
+from .zobrist import PIECE_KEYS, SIDE_KEY, castling_key, en_passant_key, compute_key
+from .evaluation import MG_TERMS, EG_TERMS, PHASE_WEIGHTS, compute_terms
+from .attackmap import AttackMap
+from .attacks import piece_attacks, iter_squares
+from .fen import parse_fen, format_fen, board_fields, load_fields
+from .encoding import encode_fields, decode_fields
+from .history import MoveHistory
 from datetime import datetime
 from copy import deepcopy
+from collections import namedtuple
 from IPython.display import display, clear_output
 
 
@@ -15,18 +25,30 @@ board -> {
 """
 
 
+MoveUndo = namedtuple('MoveUndo', ['piece', 'from_position', 'to_position', 'captured', 'captured_position',
+                                   'rook_move', 'promoted', 'occupied', 'pieces', 'king_in_check',
+                                   'attack_map', 'side_to_move', 'castling_rights', 'en_passant',
+                                   'zobrist_key', 'eval_terms', 'halfmove_clock', 'fullmove_number'])
+
+
 class Board:
     """
     A chess board
     """
-    def __init__(self, snapshots=True, fill=True):
+    def __init__(self, snapshots=True, fill=True, checkpoint_interval=None):
         self.board = {}
-        self.board_states = {}
-        self.attacked_positions = {
-            'W': {},
-            'B': {}
+        # Moves played through move_piece when snapshots is set, see app.history
+        self.history = MoveHistory(type(self), checkpoint_interval)
+        # Kept up to date as pieces are put down and lifted, see app.attackmap
+        self.attack_map = AttackMap()
+        self.occupied = {
+            'W': 0,
+            'B': 0
+        }
+        self.pieces = {
+            'W': dict.fromkeys('PNBRQK', 0),
+            'B': dict.fromkeys('PNBRQK', 0)
         }
-        self.latest_datetime = datetime.now()
         self.snapshots = snapshots
 
         self.king = {
@@ -38,10 +60,21 @@ class Board:
             'W': False,
             'B': False
         }
+
+        self.side_to_move = 'W'
+        self.castling_rights = CASTLING_RIGHTS if fill else ''
+        self.en_passant = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.zobrist_key = castling_key(self.castling_rights)
+        # Keys of the positions before this one, pushed and popped by make_move and unmake_move, see app.draws
+        self.key_history = []
+        # Evaluation sums kept up to date with the pieces, see app.evaluation
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
         if fill:
             self._fill_board()
-            self.update_attacked_positions('W')
-            self.update_attacked_positions('B')
 
     def copy(self, snapshots=False):
         new_board = Board(snapshots=snapshots, fill=False)
@@ -49,33 +82,102 @@ class Board:
         for position, piece in self.board.items():
             new_piece = piece.copy()
             new_board.board[new_piece.position] = new_piece
-        new_board.king = self.king.copy()
+        new_board.occupied = self.occupied.copy()
+        new_board.pieces = {
+            'W': self.pieces['W'].copy(),
+            'B': self.pieces['B'].copy()
+        }
+        new_board.king = {
+            color: None if king is None else new_board.board.get(king.position) for color, king in self.king.items()
+        }
         new_board.king_in_check = self.king_in_check.copy()
-        for piece, attacks in self.attacked_positions['W'].items():
-            new_board.attacked_positions['W'][piece.copy()] = attacks.copy()
-        for piece, attacks in self.attacked_positions['B'].items():
-            new_board.attacked_positions['B'][piece.copy()] = attacks.copy()
+        new_board.side_to_move = self.side_to_move
+        new_board.castling_rights = self.castling_rights
+        new_board.en_passant = self.en_passant
+        new_board.halfmove_clock = self.halfmove_clock
+        new_board.fullmove_number = self.fullmove_number
+        new_board.zobrist_key = self.zobrist_key
+        new_board.key_history = self.key_history.copy()
+        new_board.mg_score = self.mg_score
+        new_board.eg_score = self.eg_score
+        new_board.phase = self.phase
+        new_board.attack_map = self.attack_map.copy()
         return new_board
 
+    @classmethod
+    def from_fen(cls, fen):
+        return load_fields(cls, parse_fen(fen))
+
+    def to_fen(self):
+        return format_fen(board_fields(self))
+
+    @classmethod
+    def from_bytes(cls, data):
+        # See app.encoding
+        return load_fields(cls, decode_fields(data))
+
+    def to_bytes(self):
+        return encode_fields(board_fields(self))
+
     def __hash__(self):
-        hash_str = ''
-        for position, piece in self.board.items():
-            hash_str += str(piece.__hash__())
-        return hash_str.__hash__()
+        return self.zobrist_key
 
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        return self.zobrist_key == other.zobrist_key
+
+    def compute_zobrist_key(self):
+        # From scratch, zobrist_key itself is kept up to date move by move
+        return compute_key(((piece.color, piece.name, position.square) for position, piece in self.board.items()),
+                           self.side_to_move, self.castling_rights, self.en_passant)
+
+    def compute_eval_terms(self):
+        # From scratch, like compute_zobrist_key
+        return compute_terms((piece.color, piece.name, position.square) for position, piece in self.board.items())
+
+    def compute_attack_map(self):
+        # From scratch, like compute_zobrist_key
+        attack_map = AttackMap()
+        occupied = self.occupied['W'] | self.occupied['B']
+        for position, piece in self.board.items():
+            attack_map.colors[position.square] = piece.color
+            attack_map._set(position.square, piece.color,
+                            piece_attacks(piece.color, piece.name, position.square, occupied))
+        return attack_map
 
     def __getitem__(self, position):
         return self.board.get(position)
 
     def set_piece(self, piece):
-        self.board[piece.position] = piece
+        if piece.position in self.board:
+            self._remove_piece(piece.position)
+        self._add_piece(piece)
 
-    def _board_snapshot(self):
-        if self.snapshots:
-            self.latest_datetime = datetime.now()
-            self.board_states[self.latest_datetime] = self.copy()
+    def _add_piece(self, piece):
+        square = piece.position.square
+        bit = 1 << square
+        self.board[piece.position] = piece
+        self.occupied[piece.color] |= bit
+        self.pieces[piece.color][piece.name] |= bit
+        self.zobrist_key ^= PIECE_KEYS[piece.color][piece.name][square]
+        self.mg_score += MG_TERMS[piece.color][piece.name][square]
+        self.eg_score += EG_TERMS[piece.color][piece.name][square]
+        self.phase += PHASE_WEIGHTS[piece.name]
+        self.attack_map.update(self.pieces, self.occupied['W'] | self.occupied['B'], square, piece.color, piece.name)
+        if piece.name == 'K':
+            self.king[piece.color] = piece
+
+    def _remove_piece(self, position):
+        piece = self.board.pop(position)
+        square = position.square
+        mask = ~(1 << square)
+        self.occupied[piece.color] &= mask
+        self.pieces[piece.color][piece.name] &= mask
+        self.zobrist_key ^= PIECE_KEYS[piece.color][piece.name][square]
+        self.mg_score -= MG_TERMS[piece.color][piece.name][square]
+        self.eg_score -= EG_TERMS[piece.color][piece.name][square]
+        self.phase -= PHASE_WEIGHTS[piece.name]
+        self.attack_map.update(self.pieces, self.occupied['W'] | self.occupied['B'], square)
+        return piece
 
     def _fill_board(self):
 
@@ -105,7 +207,6 @@ class Board:
 
         for file in 'ABCDEFGH':
             self.set_piece(p.P(position=Position(7, file), color='B'))
-        self._board_snapshot()
 
     def view_board(self):
         for rank in range(8, 0, -1):
@@ -117,10 +218,10 @@ class Board:
             print()
 
     def view_board_history(self, sleep_time=1.5):
-        for date_time, board in self.board_states.items():
+        for ply, timestamp, board in self.history.positions():
             clear_output(wait=True)
             view_board = []
-            display(date_time)
+            display(datetime.fromtimestamp(timestamp))
 
             for rank in range(8, 0, -1):
                 file_row = []
@@ -149,32 +250,152 @@ class Board:
             return 'B'
         return 'W'
 
-    def move_piece(self, from_position, to_position):
+    def move_piece(self, from_position, to_position, promotion=None):
+        if self.snapshots and not self.history.started:
+            self.history.start(self)
+        undo = self.make_move(from_position, to_position, promotion)
+        if self.snapshots:
+            self.history.record(self, (from_position, to_position, promotion),
+                                None if undo.captured is None else undo.captured.name)
+
+    def make_move(self, from_position, to_position, promotion=None):
+        """
+        Plays a move in place and returns the undo record that unmake_move needs to take it back.
+
+        A king moving two files castles, a pawn moving onto the en-passant square takes en passant and a pawn
+        reaching the last rank becomes a promotion piece ('Q' unless given).
+        """
         piece = self.get_piece(from_position)
+        from_square = from_position.square
+        to_square = to_position.square
+
+        captured_position = to_position
         piece_taken = self.get_piece(to_position)
+        if piece_taken is None and piece.name == 'P' and self.en_passant is not None and to_position == self.en_passant:
+            captured_position = Position(rank=from_position.rank, file=to_position.file)
+            piece_taken = self.get_piece(captured_position)
+
+        rook_move = None
+        if is_castling(piece.name, from_square, to_square):
+            rook_move = tuple(Position.from_square(square) for square in CASTLING_ROOK_SQUARES[to_square])
+
+        promoted = None
+        if is_promotion(piece.name, to_square):
+            promoted = getattr(p, promotion or 'Q')(position=to_position, color=piece.color)
+
+        undo = MoveUndo(piece=piece, from_position=from_position, to_position=to_position, captured=piece_taken,
+                        captured_position=captured_position, rook_move=rook_move, promoted=promoted,
+                        occupied=self.occupied.copy(),
+                        pieces={'W': self.pieces['W'].copy(), 'B': self.pieces['B'].copy()},
+                        king_in_check=self.king_in_check.copy(), attack_map=self.attack_map,
+                        side_to_move=self.side_to_move, castling_rights=self.castling_rights,
+                        en_passant=self.en_passant, zobrist_key=self.zobrist_key,
+                        eval_terms=(self.mg_score, self.eg_score, self.phase),
+                        halfmove_clock=self.halfmove_clock, fullmove_number=self.fullmove_number)
+
+        self.key_history.append(self.zobrist_key)
+
+        # The move updates a copy of the attack map, the previous one is handed back on unmake
+        inverted_color = self._invert_color(piece.color)
+        self.attack_map = self.attack_map.copy()
         if piece_taken is not None:
-            del self.attacked_positions[self._invert_color(piece_taken.color)][piece_taken]
+            self._remove_piece(captured_position)
 
+        self._remove_piece(from_position)
         piece.move(to_position)
-        del self.board[from_position]
-        self.board[to_position] = piece
-
-        inverted_color = self._invert_color(piece.color)
-        self.attacked_positions[inverted_color][piece] = piece.get_attacked_positions(self)
-
-        self.king_in_check[piece.color] = self.king[piece.color].is_in_check(
-            self
-        )
-
-        self.king_in_check[inverted_color] = self.king[inverted_color].is_in_check(
-            self
-        )
-        self._board_snapshot()
-
-    def update_attacked_positions(self, color):
-        for piece in self.board.values():
-            if piece.color != color:
-                self.attacked_positions[color][piece] = piece.get_attacked_positions(self)
+        moved = piece if promoted is None else promoted
+        self._add_piece(moved)
+
+        if rook_move is not None:
+            rook = self._remove_piece(rook_move[0])
+            rook.move(rook_move[1])
+            self._add_piece(rook)
+
+        self._update_state(piece.name, from_square, to_square, inverted_color, piece_taken is not None)
+
+        self.king_in_check[piece.color] = self.king[piece.color].is_in_check(self)
+        self.king_in_check[inverted_color] = self.king[inverted_color].is_in_check(self)
+        return undo
+
+    def unmake_move(self, undo):
+        del self.board[undo.to_position]
+        undo.piece.move(undo.from_position)
+        self.board[undo.from_position] = undo.piece
+        if undo.rook_move is not None:
+            rook_from, rook_to = undo.rook_move
+            rook = self.board.pop(rook_to)
+            rook.move(rook_from)
+            self.board[rook_from] = rook
+        if undo.captured is not None:
+            self.board[undo.captured_position] = undo.captured
+
+        self.occupied = undo.occupied
+        self.pieces = undo.pieces
+        self.king_in_check = undo.king_in_check
+        self.attack_map = undo.attack_map
+        self.side_to_move = undo.side_to_move
+        self.castling_rights = undo.castling_rights
+        self.en_passant = undo.en_passant
+        self.zobrist_key = undo.zobrist_key
+        self.key_history.pop()
+        self.mg_score, self.eg_score, self.phase = undo.eval_terms
+        self.halfmove_clock = undo.halfmove_clock
+        self.fullmove_number = undo.fullmove_number
+
+    def make_null_move(self):
+        """
+        Passes the turn to the other side without moving anything, for null-move pruning in search. Returns the undo
+        record that unmake_null_move needs.
+        """
+        undo = (self.side_to_move, self.en_passant, self.zobrist_key, self.halfmove_clock)
+        self.key_history.append(self.zobrist_key)
+        self.zobrist_key ^= SIDE_KEY ^ en_passant_key(self.en_passant)
+        self.side_to_move = self._invert_color(self.side_to_move)
+        self.en_passant = None
+        # No position before the pass can come back after it
+        self.halfmove_clock = 0
+        return undo
+
+    def unmake_null_move(self, undo):
+        self.side_to_move, self.en_passant, self.zobrist_key, self.halfmove_clock = undo
+        self.key_history.pop()
+
+    def _update_state(self, name, from_square, to_square, side_to_move, capture=False):
+        # Side to move, castling rights, en-passant square and move counters after a move, with their Zobrist keys
+        self.halfmove_clock = 0 if name == 'P' or capture else self.halfmove_clock + 1
+        if side_to_move == 'W':
+            self.fullmove_number += 1
+
+        if side_to_move != self.side_to_move:
+            self.zobrist_key ^= SIDE_KEY
+            self.side_to_move = side_to_move
+
+        castling_rights = update_castling_rights(self.castling_rights, from_square, to_square)
+        if castling_rights != self.castling_rights:
+            self.zobrist_key ^= castling_key(self.castling_rights) ^ castling_key(castling_rights)
+            self.castling_rights = castling_rights
+
+        self.zobrist_key ^= en_passant_key(self.en_passant)
+        en_passant = en_passant_square(name, from_square, to_square)
+        self.en_passant = None if en_passant is None else Position.from_square(en_passant)
+        self.zobrist_key ^= en_passant_key(self.en_passant)
+
+    def is_attacked(self, square, by_color):
+        return self.attack_map.is_attacked(square, by_color)
+
+    @property
+    def attacked_positions(self):
+        # color -> opposing piece -> positions it attacks, built from the attack map
+        attacked_positions = {
+            'W': {},
+            'B': {}
+        }
+        for position, piece in self.board.items():
+            attacks = self.attack_map.attacks[position.square]
+            attacked_positions[self._invert_color(piece.color)][piece] = {
+                Position.from_square(square) for square in iter_squares(attacks)
+            }
+        return attacked_positions
 
     def get_attacked_positions(self, color):
         return self.attacked_positions[color]
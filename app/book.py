@@ -0,0 +1,237 @@
+import argparse
+import json
+import mmap
+import os
+import tempfile
+from array import array
+from collections import namedtuple
+from .board import Board
+from .fen import START_FEN
+from .movegen import generate_legal_moves
+from .perft import move_name
+from .tt import encode_move
+
+
+"""
+
+Opening book and position cache: search results keyed by Zobrist key, in a
+file that any number of processes map read-only and share through the page
+cache.
+
+The file is an array of unsigned 64 bit words, a two word header followed by
+two word records sorted by key:
+
+    header  [MAGIC, record count]
+    record  [key, data]
+
+data = score + 2**31 (bits 0-31) | depth (32-39) | move (40-55), the move as
+app.tt.encode_move packs it and the score from the side to move's point of
+view. A lookup is a binary search over the mapped records, nothing is read
+into memory up front.
+
+Books are built from searches of positions out of finished games (the JSONL
+of app.match) or of FEN/EPD files, merged into an existing book:
+
+    python -m app.book book.bin --games games.jsonl --plies 16 --depth 4
+    python -m app.book book.bin --openings openings.epd --depth 5
+    python -m app.book book.bin --probe "<fen>"
+
+"""
+
+MAGIC = int.from_bytes(b'CHSBOOK1', 'little')
+
+HEADER_WORDS = 2
+RECORD_WORDS = 2
+
+BookEntry = namedtuple('BookEntry', ['move', 'score', 'depth'])
+
+# Books already mapped by this process, by path, so unpickling one per task is cheap
+_attached = {}
+
+
+def _pack(move, score, depth):
+    return ((score + (1 << 31)) & 0xFFFFFFFF) | (min(depth, 255) << 32) | (move << 40)
+
+
+def _unpack(data):
+    return BookEntry(move=(data >> 40) & 0xFFFF, score=(data & 0xFFFFFFFF) - (1 << 31), depth=(data >> 32) & 0xFF)
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.words = memoryview(self._mmap).cast('Q')
+        if len(self.words) < HEADER_WORDS or self.words[0] != MAGIC or \
+                len(self.words) != HEADER_WORDS + self.words[1] * RECORD_WORDS:
+            self.close()
+            raise ValueError(f'{path} is not a book file')
+        self.size = self.words[1]
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        attached = _attached.get(state['path'])
+        if attached is None:
+            attached = _attached[state['path']] = OpeningBook(state['path'])
+        self.__dict__.update(attached.__dict__)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # (key, BookEntry) in key order
+        words = self.words
+        for index in range(HEADER_WORDS, len(words), RECORD_WORDS):
+            yield words[index], _unpack(words[index + 1])
+
+    def close(self):
+        self.words.release()
+        self._mmap.close()
+
+    def probe(self, key):
+        words = self.words
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) >> 1
+            record_key = words[HEADER_WORDS + middle * RECORD_WORDS]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return _unpack(words[HEADER_WORDS + middle * RECORD_WORDS + 1])
+        return None
+
+
+class BookBuilder:
+    """
+    Book entries gathered in memory, the deepest search of a position kept, until written out
+    """
+    def __init__(self):
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, move, score, depth):
+        """
+        move being encoded with app.tt.encode_move and score from the side to move's point of view
+        """
+        current = self.entries.get(key)
+        if current is None or depth >= (current >> 32) & 0xFF:
+            self.entries[key] = _pack(move, score, depth)
+
+    def merge(self, book):
+        for key, entry in book:
+            self.add(key, *entry)
+
+    def write(self, path):
+        """
+        Writes the book to path. The file is replaced in one step, so processes that still map the old one keep
+        reading it unharmed.
+        """
+        words = array('Q', [MAGIC, len(self.entries)])
+        for key in sorted(self.entries):
+            words.append(key)
+            words.append(self.entries[key])
+
+        fd, temporary_path = tempfile.mkstemp(prefix='.book-', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                words.tofile(f)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+
+def search_positions(builder, boards, depth, game, max_time=1e9):
+    """
+    Searches every board not yet in builder to depth plies with game.search and adds the result
+    """
+    added = 0
+    for board in boards:
+        current = builder.entries.get(board.zobrist_key)
+        if current is not None and (current >> 32) & 0xFF >= depth:
+            continue
+        result = game.search(board, board.side_to_move, max_time, depth, depth)
+        (piece, to_position), score = result.move, result.score
+        if piece is None:
+            continue
+        # Root moves leave promotions to the board's default, a queen
+        move = next(move for move in generate_legal_moves(board, board.side_to_move, piece.position)
+                    if move.to_position is to_position and move.promotion in (None, 'Q'))
+        builder.add(board.zobrist_key, encode_move(*move), score, result.stats.depth)
+        added += 1
+    return added
+
+
+def game_positions(path, plies):
+    """
+    Boards of the first plies positions of every game in a JSONL file written by app.match
+    """
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            board = Board.from_fen(record.get('opening', START_FEN))
+            for name in record['moves'][:plies]:
+                yield board.copy()
+                move = next(move for move in generate_legal_moves(board) if move_name(move) == name)
+                board.move_piece(*move)
+
+
+def main(argv=None):
+    from .chess import ChessGame
+    from .match import load_openings
+
+    parser = argparse.ArgumentParser(prog='python -m app.book', description='Build or probe an opening book')
+    parser.add_argument('book', help='book file, merged into when it exists')
+    parser.add_argument('--games', action='append', default=[], help='JSONL games of app.match')
+    parser.add_argument('--openings', action='append', default=[], help='file of FEN/EPD lines')
+    parser.add_argument('--plies', type=int, default=16, help='positions taken from the start of every game')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--tt-size-mb', type=int, default=16)
+    parser.add_argument('--probe', metavar='FEN', help='look a position up instead of building')
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        board = Board.from_fen(args.probe)
+        book = OpeningBook(args.book)
+        entry = book.probe(board.zobrist_key)
+        if entry is None:
+            print('not in book')
+            return 1
+        move = next(move for move in generate_legal_moves(board) if encode_move(*move) == entry.move)
+        print(f"{move_name(move)} score {entry.score} depth {entry.depth} ({len(book)} positions in book)")
+        return 0
+
+    builder = BookBuilder()
+    if os.path.exists(args.book):
+        book = OpeningBook(args.book)
+        builder.merge(book)
+        book.close()
+
+    def boards():
+        for path in args.openings:
+            for fen in load_openings(path):
+                yield Board.from_fen(fen)
+        for path in args.games:
+            yield from game_positions(path, args.plies)
+
+    with ChessGame(Board(snapshots=False), tt_size_mb=args.tt_size_mb, workers=args.workers) as game:
+        added = search_positions(builder, boards(), args.depth, game)
+
+    builder.write(args.book)
+    print(f"{added} positions searched, {len(builder)} in {args.book}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,204 +1,821 @@
 from .board import Board
 from functools import lru_cache
+import multiprocessing
+import os
+import threading
 import time
 import numpy as np
+from collections import namedtuple
+from multiprocessing import RawValue
 from multiprocessing.pool import Pool
+from .tt import TranspositionTable, EXACT, LOWER, UPPER, attach, encode_move, decode_move
+from .book import OpeningBook
+from .timeman import TimeManager
+from .ordering import MoveOrderer
+from .movegen import generate_legal_moves
+from .attacks import piece_attacks
+from .evaluation import PIECE_VALUES, evaluate, material
+from .draws import DRAW_SCORE, is_draw, game_result
+from .stats import SearchStats, CUTOFF_SLOTS, new_counters, reset_counters, copy_counters, timed
 
 
 def get_all_legal_moves(board, player):
-    for position, piece in board.board.items():
-        if piece.color == player:
-            legal_moves = piece.get_legal_moves(board)
-            if len(legal_moves) > 0:
-                yield piece, legal_moves
+    # Promotions collapse onto their destination square, make_move promotes to a queen by default
+    legal_moves = {}
+    for move in generate_legal_moves(board, player):
+        legal_moves.setdefault(move.from_position, set()).add(move.to_position)
+    for position, moves in legal_moves.items():
+        yield board[position], moves
 
 
 def get_score(board, player):
-    score = 0
-    for position, piece in board.board.items():
-        if piece.color == player:
-            piece_score = piece.score
-            score += piece_score
-    return score
+    # Material of player, in centipawns
+    return material(board, player)
 
 
 def get_score_difference(board, player):
-    score = 0
-    opponent_score = 0
-    for position, piece in board.board.items():
-        if piece.color == player:
-            piece_score = piece.score
-            score += piece_score
-        else:
-            piece_score = piece.score
-            opponent_score += piece_score
-    return score - opponent_score
+    # Tapered material and piece-square score from player's point of view, kept by the board move by move
+    return evaluate(board, player)
+
+
+# Centipawns a capture has to be able to win back on top of its victim before quiescence search looks at it, see
+# _quiescence
+DELTA_MARGIN = 200
+
+# Selectivity of the search, see _search_node: principal variation search, null-move pruning with a reduction of
+# null_move_reduction plies (one more with 6 or more left) and late move reductions of quiet moves from the
+# lmr_min_index-th one on, at lmr_min_depth plies left or more
+SearchOptions = namedtuple('SearchOptions', ['pvs', 'null_move', 'lmr', 'null_move_reduction', 'lmr_min_depth',
+                                             'lmr_min_index'], defaults=[True, True, True, 2, 4, 3])
+
+# Plain full-window alpha-beta, every move searched to full depth
+PLAIN_SEARCH = SearchOptions(pvs=False, null_move=False, lmr=False)
+
+# Score of checkmate, less the plies from the root to it so that the nearest mate scores best. Scores within MAX_PLY
+# of it are mates
+MATE = 1000000000
+MAX_PLY = 1000
+
+# Node budget of a search without max_nodes, see ChessGame.search
+NO_NODE_LIMIT = 2 ** 62
+
+# Best root score found so far by any pool worker, see ChessGame.get_best_move
+_root_alpha = None
+
+# Time (as time.time()) every pool worker stops searching at, moved by ChessGame.set_time and ChessGame.stop while
+# a search runs
+_deadline = None
+
+# Nodes the pool may still search, shared by every worker, and the nodes of the current task already taken off it,
+# see _out_of_nodes
+_node_budget = None
+_nodes_charged = 0
+
+# Killers and history of this process
+_move_orderer = MoveOrderer()
+
+# Work done by this process in the current task, handed back with its score, see _indexed_alphabeta_minimax
+_counters = new_counters()
+
+# Move generation and evaluation as the search calls them, timed into _counters when profiling, see _set_profiling
+_generate_moves = generate_legal_moves
+_evaluate = get_score_difference
+
+# Result of ChessGame.search: move being (piece, to_position), scores the score of every root move of the last
+# completed iteration
+SearchResult = namedtuple('SearchResult', ['move', 'score', 'scores', 'stats'])
+
+
+def _init_worker(root_alpha, deadline=None, node_budget=None, tt=None):
+    global _root_alpha, _deadline, _node_budget
+    _root_alpha = root_alpha
+    _deadline = deadline
+    _node_budget = node_budget
+    if tt is not None:
+        attach(tt)
+
+
+def _time_up(start_time, max_time):
+    now = time.time()
+    return now - start_time >= max_time or (_deadline is not None and now >= _deadline.value) or _out_of_nodes()
+
+
+def _out_of_nodes():
+    # Takes the nodes searched since the last call off the shared budget. Unlocked: a lost update only lets the
+    # search run a few nodes over
+    global _nodes_charged
+    if _node_budget is None:
+        return False
+    searched = _counters['nodes'] + _counters['qnodes']
+    _node_budget.value -= searched - _nodes_charged
+    _nodes_charged = searched
+    return _node_budget.value <= 0
+
+
+def _aborted():
+    # A negative deadline stops even the iterations up to min_depth, see ChessGame.abort
+    return _deadline is not None and _deadline.value < 0
+
+
+def _set_profiling(enabled):
+    global _generate_moves, _evaluate
+    if enabled:
+        _generate_moves = timed(generate_legal_moves, _counters, 'movegen_time')
+        _evaluate = timed(get_score_difference, _counters, 'evaluation_time')
+    else:
+        _generate_moves = generate_legal_moves
+        _evaluate = get_score_difference
+
+
+def _tt_score(score, bound, player):
+    # The transposition table holds scores from white's point of view
+    if player == 'W':
+        return score, bound
+    return -score, {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}[bound]
+
+
+def _shift_mate(score, plies):
+    # Mate scores count plies from the root, the table's count them from the position stored: shifted by plies
+    if score >= MATE - MAX_PLY:
+        return score + plies
+    if score <= MAX_PLY - MATE:
+        return score - plies
+    return score
 
 
 def alphabeta_minimax(args):
     piece, move_position, board, player, current_player, start_time, max_time, depth, max_depth, min_depth,\
-    alpha, beta = args
+    alpha, beta = args[:12]
+    tt = args[12] if len(args) > 12 else None
+    quiescence = args[13] if len(args) > 13 else False
+    key_history = args[14] if len(args) > 14 else None
+    options = args[15] if len(args) > 15 else None
+    profile = args[16] if len(args) > 16 else False
 
     if start_time == 0:
         start_time = time.time()
 
-    if (time.time() - start_time >= max_time and depth >= min_depth) or depth >= max_depth:
-        return get_score_difference(board, player)
+    # Root moves only have to beat the best sibling so far. One below it, so a move that ties still gets an exact
+    # score rather than a bound
+    if _root_alpha is not None and depth == 0:
+        alpha = max(alpha, _root_alpha.value - 1)
+
+    if tt is not None:
+        _move_orderer.new_search(tt.generation)
+    _set_profiling(profile)
+
+    # One board per task: every node below plays and takes back its move on it. Root tasks ship the position
+    # encoded, see app.encoding
+    board = Board.from_bytes(board) if isinstance(board, bytes) else board.copy()
+    if key_history is not None:
+        board.key_history = list(key_history)
+    score = _alphabeta(board, piece.position, move_position, player, current_player, start_time, max_time,
+                       depth, max_depth, min_depth, alpha, beta, tt, _move_orderer, quiescence=quiescence,
+                       options=options)
+
+    # Unlocked: losing a race only leaves a weaker bound for the next root move
+    if _root_alpha is not None and depth == 0 and score > _root_alpha.value:
+        _root_alpha.value = score
+    return score
+
 
-    board_copy = board.copy()
-    piece_copy = piece.copy()
-    board_copy.move_piece(piece_copy.position, move_position)
+def _alphabeta(board, from_position, move_position, player, current_player, start_time, max_time, depth, max_depth,
+               min_depth, alpha, beta, tt=None, orderer=None, promotion=None, quiescence=False, options=None):
+    if depth >= max_depth and quiescence:
+        # current_player is the side to move on the board here, the move handed in is never played
+        return _quiescence(board, player, current_player, alpha, beta, orderer)
+    if depth >= max_depth or ((depth >= min_depth or _aborted()) and _time_up(start_time, max_time)):
+        return _evaluate(board, player)
 
-    current_player = 'W' if current_player is 'B' else 'B'
+    undo = board.make_move(from_position, move_position, promotion)
+    _counters['nodes'] += 1
 
+    current_player = 'W' if current_player == 'B' else 'B'
+
+    # Scores of repeated positions depend on the path here, so they never go into the table
+    if is_draw(board):
+        value = DRAW_SCORE
+    else:
+        value = _search_node(board, player, current_player, start_time, max_time, depth, max_depth, min_depth,
+                             alpha, beta, tt, orderer, quiescence, options)
+
+    board.unmake_move(undo)
+    return value
+
+
+def _has_pieces(board, color):
+    # Anything besides pawns and the king: without, passing may well be the best move (zugzwang)
+    pieces = board.pieces[color]
+    return bool(pieces['N'] | pieces['B'] | pieces['R'] | pieces['Q'])
+
+
+def _is_quiet(board, move):
+    # Neither a capture nor a promotion, nor a direct check
+    if move.promotion is not None or board[move.to_position] is not None:
+        return False
+    piece = board[move.from_position]
+    if move.to_position is board.en_passant and piece.name == 'P':
+        return False
+    enemy_king = board.pieces['W' if piece.color == 'B' else 'B']['K']
+    occupied = board.occupied['W'] | board.occupied['B']
+    return not piece_attacks(piece.color, piece.name, move.to_position.square, occupied) & enemy_king
+
+
+def _reduction(board, move, index, remaining, in_check, options, killers):
+    # Plies taken off a late quiet move, 0 for moves searched to full depth
+    if options is None or not options.lmr or in_check or index < options.lmr_min_index or \
+            remaining < options.lmr_min_depth:
+        return 0
+    if not _is_quiet(board, move) or encode_move(*move) in killers:
+        return 0
+    return 2 if index >= 2 * options.lmr_min_index and remaining >= 6 else 1
+
+
+def _null_move_score(board, player, current_player, start_time, max_time, depth, max_depth, min_depth, alpha,
+                     beta, tt, orderer, quiescence, options):
+    # Score of the position with current_player passing, searched with a zero window at the bound it has to beat
+    reduction = options.null_move_reduction + (max_depth - depth >= 6)
+    opponent = 'W' if current_player == 'B' else 'B'
     if current_player == player:
-        value = -1000000000
+        alpha = beta - 1
+    else:
+        beta = alpha + 1
 
-        legal_moves = get_all_legal_moves(board_copy, current_player)
+    undo = board.make_null_move()
+    null_depth = depth + 1 + reduction
+    if null_depth + 1 >= max_depth:
+        if quiescence:
+            score = _quiescence(board, player, opponent, alpha, beta, orderer)
+        else:
+            score = _evaluate(board, player)
+    else:
+        score = _search_node(board, player, opponent, start_time, max_time, null_depth, max_depth, min_depth, alpha,
+                             beta, tt, orderer, quiescence, options, allow_null=False)
+    board.unmake_null_move(undo)
+    return score
 
-        for new_piece, legal_moves in legal_moves:
-            for move in legal_moves:
-                value = max(value, alphabeta_minimax((new_piece, move, board_copy, player,
-                                                      current_player, start_time, max_time, depth+1, max_depth, min_depth,
-                                                      alpha, beta)))
-                alpha = max(alpha, value)
-                if alpha >= beta:
-                    break
-            if alpha >= beta:
-                break
-        return value
+
+def _search_node(board, player, current_player, start_time, max_time, depth, max_depth, min_depth, alpha, beta,
+                 tt=None, orderer=None, quiescence=False, options=None, allow_null=True):
+    """
+    Searches the moves of current_player, to move on board, at depth plies from the root. player maximizes.
+    """
+    hash_move = 0
+    if tt is not None:
+        entry = tt.probe(board.zobrist_key)
+        _counters['tt_probes'] += 1
+        if entry is not None:
+            _counters['tt_hits'] += 1
+            hash_move = entry.move
+            if entry.depth >= max_depth - depth:
+                score, bound = _tt_score(entry.score, entry.bound, player)
+                score = _shift_mate(score, -depth - 1)
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    _counters['tt_cutoffs'] += 1
+                    return score
+
+    moves = _generate_moves(board, current_player)
+    in_check = board.king_in_check[current_player]
+    maximizing = current_player == player
+    if not moves:
+        if not in_check:
+            return DRAW_SCORE
+        # Mated, depth + 1 plies from the root
+        return MATE - depth - 1 if not maximizing else depth + 1 - MATE
+
+    # Every move from here ends on a leaf, and leaves are scored on the position they are reached from, this one:
+    # score it once rather than once per move
+    if moves and depth + 1 >= max_depth:
+        if quiescence:
+            return _quiescence(board, player, current_player, alpha, beta, orderer)
+        return _evaluate(board, player)
+
+    # Null move: when even passing keeps the score past the bound, a real move would too. Not in check, where
+    # passing is illegal, and not with pawns only, where it can be the best move
+    if options is not None and options.null_move and allow_null and not in_check and \
+            _has_pieces(board, current_player):
+        static = _evaluate(board, player)
+        if (maximizing and static >= beta) or (not maximizing and static <= alpha):
+            score = _null_move_score(board, player, current_player, start_time, max_time, depth, max_depth,
+                                     min_depth, alpha, beta, tt, orderer, quiescence, options)
+            if (maximizing and score >= beta) or (not maximizing and score <= alpha):
+                _counters['null_cutoffs'] += 1
+                return beta if maximizing else alpha
+
+    if orderer is not None:
+        moves = orderer.order(board, moves, depth, hash_move)
+    killers = orderer.killers.get(depth, []) if orderer is not None else []
+    pvs = options is not None and options.pvs
+
+    def search(move, low, high, reduction=0):
+        return _alphabeta(board, move.from_position, move.to_position, player, current_player, start_time, max_time,
+                          depth + 1 + reduction, max_depth, min_depth, low, high, tt, orderer, move.promotion,
+                          quiescence, options)
+
+    alpha_orig, beta_orig = alpha, beta
+    best_move = 0
+    value = -1000000000 if maximizing else 1000000000
+
+    for index, move in enumerate(moves):
+        reduction = _reduction(board, move, index, max_depth - depth, in_check, options, killers)
+        if index == 0 or not (pvs or reduction):
+            score = search(move, alpha, beta)
+        else:
+            # Principal variation search: a later move only has to be shown no better than the best so far, with a
+            # zero window, and a reduced one no better at reduced depth. Either failing means searching it again,
+            # at full depth and then with the full window.
+            if maximizing:
+                low, high = (alpha, alpha + 1) if pvs else (alpha, beta)
+            else:
+                low, high = (beta - 1, beta) if pvs else (alpha, beta)
+            score = search(move, low, high, reduction)
+            if reduction and (score > alpha if maximizing else score < beta):
+                score = search(move, low, high)
+            if pvs and alpha < score < beta:
+                score = search(move, alpha, beta)
+
+        if maximizing:
+            if not best_move or score > value:
+                best_move = encode_move(*move)
+            value = max(value, score)
+            alpha = max(alpha, value)
+        else:
+            if not best_move or score < value:
+                best_move = encode_move(*move)
+            value = min(value, score)
+            beta = min(beta, value)
+        if alpha >= beta:
+            _counters['beta_cutoffs'] += 1
+            _counters['cutoff_index'][min(index, CUTOFF_SLOTS - 1)] += 1
+            if orderer is not None:
+                orderer.update(board, move, depth, max_depth - depth)
+            break
+
+    # Results cut short by the clock are not worth keeping
+    if tt is not None and not _time_up(start_time, max_time):
+        if value <= alpha_orig:
+            bound = UPPER
+        elif value >= beta_orig:
+            bound = LOWER
+        else:
+            bound = EXACT
+        tt.store(board.zobrist_key, max_depth - depth, *_tt_score(_shift_mate(value, depth + 1), bound, player),
+                 best_move)
+
+    return value
+
+
+def _capture_gain(board, move):
+    victim = board[move.to_position]
+    gain = PIECE_VALUES['P'] if victim is None else PIECE_VALUES[victim.name]
+    if move.promotion is not None:
+        gain += PIECE_VALUES[move.promotion] - PIECE_VALUES['P']
+    return gain
+
+
+def _quiescence(board, player, current_player, alpha, beta, orderer=None):
+    """
+    Extends a leaf with captures and promotions only, until the position is quiet. current_player is the side to
+    move and may stand pat on the static score instead of taking anything.
+    """
+    _counters['qnodes'] += 1
+    stand_pat = _evaluate(board, player)
+    maximizing = current_player == player
+    if maximizing:
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
     else:
-        value = 1000000000
+        if stand_pat <= alpha:
+            return stand_pat
+        beta = min(beta, stand_pat)
+
+    moves = _generate_moves(board, current_player, captures_only=True)
+    if orderer is not None:
+        moves = orderer.order(board, moves, 0)
+
+    value = stand_pat
+    next_player = 'W' if current_player == 'B' else 'B'
+    for move in moves:
+        # Delta pruning: skip captures that cannot lift the score back over the bound even with some to spare
+        gain = _capture_gain(board, move) + DELTA_MARGIN
+        if (maximizing and stand_pat + gain <= alpha) or (not maximizing and stand_pat - gain >= beta):
+            continue
+
+        undo = board.make_move(*move)
+        score = _quiescence(board, player, next_player, alpha, beta, orderer)
+        board.unmake_move(undo)
+
+        if maximizing:
+            value = max(value, score)
+            alpha = max(alpha, value)
+        else:
+            value = min(value, score)
+            beta = min(beta, value)
+        if alpha >= beta:
+            break
+    return value
 
-        legal_moves = get_all_legal_moves(board_copy, current_player)
 
-        for new_piece, legal_moves in legal_moves:
-            for move in legal_moves:
-                value = min(value, alphabeta_minimax((new_piece, move, board_copy, player,
-                                                      current_player, start_time, max_time, depth+1, max_depth, min_depth,
-                                                      alpha, beta)))
-                beta = min(beta, value)
-                if beta <= alpha:
-                    break
-            if beta <= alpha:
-                break
-        return value
+def _indexed_alphabeta_minimax(indexed_args):
+    global _nodes_charged
+    counter, args = indexed_args
+    reset_counters(_counters)
+    _nodes_charged = 0
+    score = alphabeta_minimax(args)
+    # The nodes since the last clock check count too
+    _out_of_nodes()
+    return counter, score, copy_counters(_counters)
 
 
 def minimax(args):
     piece, move_position, board, player, current_player, depth, max_depth = args
+    return _minimax(board.copy(), piece.position, move_position, player, current_player, depth, max_depth)
+
+
+def _minimax(board, from_position, move_position, player, current_player, depth, max_depth):
     if depth >= max_depth:
         return get_score_difference(board, player)
 
-    board_copy = board.copy()
-    piece_copy = piece.copy()
-    board_copy.move_piece(piece_copy.position, move_position)
+    undo = board.make_move(from_position, move_position)
 
     if current_player == player:
         value = -1000000000
 
-        current_player = 'W' if current_player is 'B' else 'B'
-        legal_moves = get_all_legal_moves(board_copy, current_player)
+        current_player = 'W' if current_player == 'B' else 'B'
+        legal_moves = list(get_all_legal_moves(board, current_player))
 
         for new_piece, legal_moves in legal_moves:
             for move in legal_moves:
-                value = max(value, minimax((new_piece, move, board_copy, player, current_player, depth + 1, max_depth)))
-        return value
+                value = max(value, _minimax(board, new_piece.position, move, player, current_player, depth + 1,
+                                            max_depth))
     else:
         value = 1000000000
 
-        current_player = 'W' if current_player is 'B' else 'B'
-        legal_moves = get_all_legal_moves(board_copy, current_player)
+        current_player = 'W' if current_player == 'B' else 'B'
+        legal_moves = list(get_all_legal_moves(board, current_player))
 
         for new_piece, legal_moves in legal_moves:
             for move in legal_moves:
-                value = min(value, minimax((new_piece, move, board_copy, player, current_player, depth + 1, max_depth)))
-        return value
+                value = min(value, _minimax(board, new_piece.position, move, player, current_player, depth + 1,
+                                            max_depth))
+
+    board.unmake_move(undo)
+    return value
 
 
 def _get_score(args):
     piece, move_position, board, player, current_player, depth, max_depth = args
+    return _get_best_score(board.copy(), piece.position, move_position, player, current_player, depth, max_depth)
+
+
+def _get_best_score(board, from_position, move_position, player, current_player, depth, max_depth):
     if depth >= max_depth:
         return get_score_difference(board, player)
 
-    piece_copy = piece.copy()
     best_score = -100000
-    board_copy = board.copy()
-    board_copy.move_piece(piece_copy.position, move_position)
+    undo = board.make_move(from_position, move_position)
 
     if current_player == 'W':
         new_current_player = 'B'
     else:
         new_current_player = 'W'
 
-    legal_moves = get_all_legal_moves(board_copy, new_current_player)
+    legal_moves = list(get_all_legal_moves(board, new_current_player))
 
     for new_piece, legal_moves in legal_moves:
         for move in legal_moves:
 
-            new_score = _get_score((new_piece, move, board_copy.copy(), player, new_current_player,
-                                              depth + 1, max_depth))
+            new_score = _get_best_score(board, new_piece.position, move, player, new_current_player, depth + 1,
+                                        max_depth)
             if new_score > best_score:
                 best_score = new_score
 
+    board.unmake_move(undo)
     return best_score
 
 
 class ChessGame:
-    def __init__(self, board, player_1='W', player_2='B'):
+    def __init__(self, board, player_1='W', player_2='B', tt_size_mb=16, workers=None, quiescence=True, book=None,
+                 search_options=None, profile=False, stats_stream=None):
         self.board = board
         self.player_1 = player_1
         self.player_2 = player_2
         self.max_depth = 10
-        self.cache = {}
-        self.pool = Pool(100)
-
-    def get_best_move(self, board, player, max_time, max_depth, min_depth):
+        # Leaves are searched on through captures and promotions, see _quiescence
+        self.quiescence = quiescence
+        self.search_options = search_options or SearchOptions()
+        # Shared by every pool worker, see app.tt
+        self.cache = TranspositionTable(size_mb=tt_size_mb)
+        self.root_alpha = RawValue('q', -1000000000)
+        self.deadline = RawValue('d', float('inf'))
+        self.node_budget = RawValue('q', NO_NODE_LIMIT)
+        self.soft_deadline = float('inf')
+        self.workers = workers or os.cpu_count()
+        self.pool = self._start_pool()
+        # Positions answered without a search, see app.book. A path or an OpeningBook
+        self.book = OpeningBook(book) if isinstance(book, str) else book
+        # Counts of the last search, see app.stats. With profile, workers also time move generation and
+        # evaluation, and with a stats_stream every completed iteration and search is written to it as a JSON line
+        self.stats = SearchStats()
+        self.profile = profile
+        self.stats_stream = stats_stream
+        # Background search of the position after the expected reply, see ponder
+        self._ponder_thread = None
+        self._ponder_result = None
+
+    def _start_pool(self):
+        pool = Pool(self.workers, initializer=_init_worker,
+                    initargs=(self.root_alpha, self.deadline, self.node_budget, self.cache))
+        # Forked workers map the table from the start, so its file can go at once and nothing is left in /dev/shm
+        # however this process ends. Other start methods open the table by its path
+        if multiprocessing.get_start_method() == 'fork':
+            self.cache.unlink()
+        return pool
+
+    def close(self):
+        """
+        Stops any ponder search and the pool of workers, and frees the transposition table. No search can follow.
+        """
+        if self.pondering:
+            self.ponder_miss()
+        self.pool.terminate()
+        self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def set_table_size(self, size_mb):
+        """
+        Replaces the transposition table with an empty one of size_mb, on a new pool of workers
+        """
+        self.pool.terminate()
+        self.cache.close()
+        self.cache = TranspositionTable(size_mb=size_mb)
+        self.pool = self._start_pool()
+
+    def get_best_move(self, board, player, max_time, max_depth, min_depth, soft_time=None):
+        """
+        Best move and score of search, printing the scores of the root moves
+        """
+        result = self.search(board, player, max_time, max_depth, min_depth, soft_time)
+        if result.move[0] is not None:
+            if result.scores:
+                print(result.scores)
+            print(result.move, result.score)
+        return result.move, result.score
+
+    def search(self, board, player, max_time, max_depth, min_depth, soft_time=None, max_nodes=None,
+               on_iteration=None):
+        """
+        Iterative deepening from 1 to max_depth plies, returning a SearchResult whose stats (also left in self.stats)
+        count the work done.
+
+        max_time is a single deadline for the whole search, shared by every worker. Iterations up to min_depth
+        always finish; past it, an iteration cut by the deadline is thrown away and the best move of the last
+        completed one is returned. No new iteration starts once soft_time (max_time by default) has passed. max_nodes
+        limits the positions searched, quiescence search included, like max_time: workers stop once the pool has
+        searched that many. With max_time None, the deadlines last given to set_time hold, for a
+        caller that starts the clock itself; either can be moved or cut short by set_time and stop from another
+        thread while the search runs.
+
+        on_iteration(depth, move, score, stats) is called after every completed iteration with its best move.
+
+        A position in the book searched to min_depth or deeper is answered from there without searching.
+        """
+        start_time = time.time()
+        if max_time is not None:
+            self.set_time(max_time if soft_time is None else soft_time, max_time)
         board_copy = board.copy()
+        self.cache.new_search()
+        self.node_budget.value = NO_NODE_LIMIT if max_nodes is None else max_nodes
 
-        all_args = []
-
-        for piece, legal_moves in get_all_legal_moves(board_copy, player):
-            for move in legal_moves:
-                all_args.append((piece, move, board_copy, player, player, 0, max_time, 0, max_depth, min_depth,
-                                 -1000000000,
-                                 1000000000))
+        root_moves = [(piece, move) for piece, legal_moves in get_all_legal_moves(board_copy, player)
+                      for move in legal_moves]
+        self.stats = stats = SearchStats()
+        if not root_moves:
+            return self._finish_search((None, None), None, {})
 
-        counter = 0
+        book_move = self._probe_book(board_copy, player, root_moves, min_depth)
+        if book_move is not None:
+            return self._finish_search(*book_move, {})
 
         all_node_scores = {}
+        for depth in range(1, max_depth + 1):
+            node_scores = self._search_root(board_copy, player, root_moves, start_time,
+                                            self.deadline.value - start_time, depth, min_depth)
+            out_of_nodes = self.node_budget.value <= 0
+            if (depth > min_depth and (out_of_nodes or time.time() >= self.deadline.value)) or \
+                    self.deadline.value < 0:
+                break
+            all_node_scores = node_scores
+            stats.complete_iteration(depth)
+
+            # Best moves of this iteration go first in the next one
+            root_moves.sort(key=lambda node: all_node_scores[node], reverse=True)
+            if on_iteration is not None:
+                on_iteration(depth, root_moves[0], all_node_scores[root_moves[0]], stats)
+            if self.stats_stream is not None:
+                piece, move = root_moves[0]
+                stats.write(self.stats_stream, 'iteration', move=f"{piece.position}{move}".lower(),
+                            score=all_node_scores[root_moves[0]])
+            if time.time() >= self.soft_deadline or out_of_nodes:
+                break
 
-        for new_score in self.pool.imap(alphabeta_minimax, all_args):
-            all_node_scores[(all_args[counter][0], all_args[counter][1])] = new_score
-            counter += 1
-
+        if not all_node_scores:
+            # Aborted in its first iteration
+            return self._finish_search((None, None), None, {})
         best_score = max(all_node_scores.values())
         best_nodes = [node for node, score in all_node_scores.items() if score == best_score]
-        print(all_node_scores)
         best_node = best_nodes[np.random.choice(range(len(best_nodes)), 1)[0]]
-        print(best_node, best_score)
-        return best_node, best_score
+        return self._finish_search(best_node, best_score, all_node_scores)
+
+    def set_time(self, soft_time, max_time):
+        """
+        Soft and hard limits, in seconds from now, of the search running or about to run
+        """
+        now = time.time()
+        self.soft_deadline = now + soft_time
+        self.deadline.value = now + max_time
+
+    def stop(self):
+        # Workers stop at the next node they reach, the search returns the best move of its last completed iteration
+        self.soft_deadline = 0.
+        self.deadline.value = 0.
+
+    def abort(self):
+        # Like stop, but the iterations up to min_depth are cut short too, for a search whose result is not wanted
+        self.soft_deadline = 0.
+        self.deadline.value = -1.
+
+    def _finish_search(self, move, score, scores):
+        self.stats.finish()
+        if self.stats_stream is not None:
+            piece, to_position = move
+            self.stats.write(self.stats_stream, 'search', score=score,
+                             move=None if piece is None else f"{piece.position}{to_position}".lower())
+        return SearchResult(move=move, score=score, scores=scores, stats=self.stats)
+
+    def _probe_book(self, board, player, root_moves, min_depth):
+        # Book entries are for the side to move of their position
+        if self.book is None or player != board.side_to_move:
+            return None
+        entry = self.book.probe(board.zobrist_key)
+        if entry is None or entry.depth < min_depth:
+            return None
+        from_square, to_square, _ = decode_move(entry.move)
+        for piece, move in root_moves:
+            if piece.position.square == from_square and move.square == to_square:
+                self.stats.depth = entry.depth
+                self.stats.book = True
+                return (piece, move), entry.score
+        return None
+
+    def _search_root(self, board, player, root_moves, start_time, max_time, max_depth, min_depth):
+        encoded = board.to_bytes()
+        # Only positions since the last capture or pawn move can come back
+        key_history = board.key_history[max(0, len(board.key_history) - board.halfmove_clock):]
+        all_args = [(piece, move, encoded, player, player, start_time, max_time, 0, max_depth, min_depth,
+                     -1000000000, 1000000000, self.cache, self.quiescence, key_history, self.search_options,
+                     self.profile)
+                    for piece, move in root_moves]
 
-    def play(self, board, max_time=5, max_depth=50, min_depth=3):
-        current_player = 'W'
+        all_node_scores = {}
+
+        # Young brothers wait: the eldest root move is searched alone and its score becomes the alpha every other
+        # root move is searched against. Idle workers then take the younger moves one at a time, raising the shared
+        # alpha and filling the shared table as they go
+        self.root_alpha.value = -1000000000
+        results = [self.pool.apply(_indexed_alphabeta_minimax, ((0, all_args[0]),))]
+        results.extend(self.pool.imap_unordered(_indexed_alphabeta_minimax, enumerate(all_args[1:], 1)))
+
+        for counter, new_score, counters in results:
+            all_node_scores[root_moves[counter]] = new_score
+            self.stats.add(counters)
+
+        return all_node_scores
+
+    def expected_reply(self, board):
+        """
+        The Move the search expects next on board, the best move the table holds for it, or None
+        """
+        entry = self.cache.probe(board.zobrist_key)
+        if entry is None or not entry.move:
+            return None
+        from_square, to_square, promotion = decode_move(entry.move)
+        return next((move for move in generate_legal_moves(board) if move.from_position.square == from_square
+                     and move.to_position.square == to_square and move.promotion in (promotion, 'Q')), None)
+
+    def ponder(self, board, player, max_depth=50, min_depth=1):
+        """
+        Starts searching board, player to move, in the background and with no time limit, ahead of the opponent
+        playing into it. ponderhit turns it into the search for the move, ponder_miss throws it away.
+        """
+        self.set_time(float('inf'), float('inf'))
+        self._ponder_result = None
+
+        def run():
+            self._ponder_result = self.search(board, player, None, max_depth, min_depth)
+
+        self._ponder_thread = threading.Thread(target=run, daemon=True)
+        self._ponder_thread.start()
+
+    def ponderhit(self, max_time, soft_time=None):
+        """
+        The opponent played the move pondered on: the running search carries on, its table, killers and history
+        intact, under the limits of a search started now. Returns its SearchResult.
+        """
+        self.set_time(max_time if soft_time is None else soft_time, max_time)
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        return self._ponder_result
+
+    def ponder_miss(self):
+        # Workers stop at their next node; what the search stored in the table stays
+        self.abort()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self._ponder_result = None
+
+    @property
+    def pondering(self):
+        return self._ponder_thread is not None
+
+    def play(self, board, max_time=5, max_depth=50, min_depth=3, clock=None, increment=0,
+             time_manager=None, opponent=None, ponder=False):
+        """
+        Self-play from board until the game is over, returning (result, reason) from app.draws.game_result. With
+        clock (seconds per side), every move gets its soft and hard limits from the time manager and the time it
+        took comes off that side's clock, otherwise every move gets max_time.
+
+        With opponent, a function from the board to the Move it plays, the engine only plays player_1 and opponent
+        plays player_2. With ponder as well, the engine searches the reply it expects while opponent thinks: when
+        opponent plays it, that search goes on as the search for the next move, otherwise it is stopped.
+        """
+        time_manager = time_manager or TimeManager()
+        remaining = {
+            'W': clock,
+            'B': clock
+        }
+        current_player = board.side_to_move
         board.view_board()
         print()
 
-        while True:
-            (piece, move_position), _ = self.get_best_move(board, current_player, max_time, max_depth, min_depth)
-            if piece is None:
-                break
-            board.move_piece(piece.position, move_position)
-
-            print(f"{current_player} Moves {piece} to {move_position}")
-            board.view_board()
-            print()
-
-            if current_player == 'W':
-                current_player = 'B'
-            else:
-                current_player = 'W'
-
-
-
-
+        expected = None
+        try:
+            while True:
+                result = game_result(board)
+                if result is not None:
+                    print(*result)
+                    return result
+
+                if clock is None:
+                    soft_time, hard_time = max_time, max_time
+                else:
+                    soft_time, hard_time = time_manager.allocate(remaining[current_player], increment)
+
+                move_start = time.time()
+                if opponent is not None and current_player == self.player_2:
+                    move = opponent(board)
+                    piece, move_position = board[move.from_position], move.to_position
+                    if self.pondering and move != expected:
+                        self.ponder_miss()
+                elif self.pondering:
+                    search = self.ponderhit(hard_time, soft_time)
+                    (piece, move_position), _ = search.move, search.score
+                    print(search.move, search.score)
+                    move = None
+                else:
+                    (piece, move_position), _ = self.get_best_move(board, current_player, hard_time, max_depth,
+                                                                   min_depth, soft_time=soft_time)
+                    move = None
+                if piece is None:
+                    return None
+                if clock is not None:
+                    remaining[current_player] += increment - (time.time() - move_start)
+                if move is None:
+                    board.move_piece(piece.position, move_position)
+                else:
+                    board.move_piece(*move)
+
+                if ponder and opponent is not None and current_player == self.player_1:
+                    expected = self.expected_reply(board)
+                    if expected is not None:
+                        ponder_board = board.copy()
+                        ponder_board.make_move(*expected)
+                        self.ponder(ponder_board, current_player, max_depth, min_depth)
+
+                print(f"{current_player} Moves {piece} to {move_position}")
+                board.view_board()
+                print()
+
+                if current_player == 'W':
+                    current_player = 'B'
+                else:
+                    current_player = 'W'
+        finally:
+            if self.pondering:
+                self.ponder_miss()
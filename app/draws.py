@@ -0,0 +1,75 @@
+from .movegen import generate_legal_moves
+
+
+"""
+
+Game end detection. Repetitions are found on the board's key_history, the
+Zobrist keys of the positions before the current one, most recent last.
+Only positions since the last capture or pawn move (halfmove_clock plies)
+can repeat, and only every second one has the same side to move, so the scan
+stops there.
+
+"""
+
+DRAW_SCORE = 0
+
+# Colors of the squares of a bishop: light squares, dark squares
+LIGHT_SQUARES = 0x55AA55AA55AA55AA
+DARK_SQUARES = 0xAA55AA55AA55AA55
+
+
+def repetition_count(board):
+    """
+    Earlier occurrences of the current position
+    """
+    keys = board.key_history
+    limit = min(board.halfmove_clock, len(keys))
+    key = board.zobrist_key
+    return sum(1 for ply in range(2, limit + 1, 2) if keys[-ply] == key)
+
+
+def is_repetition(board):
+    # In search a position met once before is already a draw, the side that could avoid it will
+    return repetition_count(board) > 0
+
+
+def is_fifty_move_draw(board):
+    return board.halfmove_clock >= 100
+
+
+def has_insufficient_material(board):
+    """
+    Neither side can mate: bare kings, a single minor piece, or bishops only all on squares of one color
+    """
+    white, black = board.pieces['W'], board.pieces['B']
+    if white['P'] | black['P'] | white['R'] | black['R'] | white['Q'] | black['Q']:
+        return False
+    knights = white['N'] | black['N']
+    bishops = white['B'] | black['B']
+    if not knights and not (bishops & LIGHT_SQUARES and bishops & DARK_SQUARES):
+        return True
+    return not bishops and bin(knights).count('1') == 1
+
+
+def is_draw(board):
+    # Draws that do not need the legal moves, cheap enough for every search node
+    return is_fifty_move_draw(board) or has_insufficient_material(board) or is_repetition(board)
+
+
+def game_result(board):
+    """
+    (result, reason) when the game is over with board.side_to_move to move, result being '1-0', '0-1' or
+    '1/2-1/2', otherwise None
+    """
+    color = board.side_to_move
+    if not generate_legal_moves(board, color):
+        if board.king_in_check[color]:
+            return ('0-1' if color == 'W' else '1-0'), 'checkmate'
+        return '1/2-1/2', 'stalemate'
+    if repetition_count(board) >= 2:
+        return '1/2-1/2', 'threefold repetition'
+    if is_fifty_move_draw(board):
+        return '1/2-1/2', 'fifty-move rule'
+    if has_insufficient_material(board):
+        return '1/2-1/2', 'insufficient material'
+    return None
@@ -0,0 +1,67 @@
+import struct
+from .fen import PositionFields
+from .position import Position
+from .rules import CASTLING_RIGHTS
+
+
+"""
+
+Fixed size binary encoding of a position, 30 bytes:
+
+    occupied   8 bytes  bitboard of every occupied square
+    pieces    16 bytes  one nibble per occupied square, lowest square first: color << 3 | piece index
+    flags      1 byte   black to move (bit 4) | castling rights (bits 0-3, KQkq)
+    en passant 1 byte   file 1-8 of the en-passant square, 0 for none
+    halfmove   2 bytes
+    fullmove   2 bytes
+
+A legal position has at most 32 pieces, so the nibbles always fit.
+
+"""
+
+_FORMAT = struct.Struct('<Q16sBBHH')
+ENCODED_SIZE = _FORMAT.size
+
+PIECE_INDEX = 'PNBRQK'
+
+
+def encode_fields(fields):
+    pieces = sorted(fields.pieces, key=lambda piece: piece[2])
+    if len(pieces) > 32:
+        raise ValueError('A position holds 32 pieces at most')
+
+    occupied = 0
+    nibbles = bytearray(16)
+    for index, (color, name, square) in enumerate(pieces):
+        occupied |= 1 << square
+        nibbles[index >> 1] |= ((color == 'B') << 3 | PIECE_INDEX.index(name)) << (4 * (index & 1))
+
+    flags = (fields.side_to_move == 'B') << 4
+    for bit, right in enumerate(CASTLING_RIGHTS):
+        if right in fields.castling_rights:
+            flags |= 1 << bit
+    en_passant = 0 if fields.en_passant is None else fields.en_passant.file
+    return _FORMAT.pack(occupied, bytes(nibbles), flags, en_passant, fields.halfmove_clock, fields.fullmove_number)
+
+
+def decode_fields(data):
+    occupied, nibbles, flags, en_passant, halfmove_clock, fullmove_number = _FORMAT.unpack(data)
+
+    pieces = []
+    index = 0
+    while occupied:
+        square = (occupied & -occupied).bit_length() - 1
+        occupied &= occupied - 1
+        nibble = (nibbles[index >> 1] >> (4 * (index & 1))) & 15
+        pieces.append(('B' if nibble & 8 else 'W', PIECE_INDEX[nibble & 7], square))
+        index += 1
+
+    side_to_move = 'B' if flags & 16 else 'W'
+    castling_rights = ''.join(right for bit, right in enumerate(CASTLING_RIGHTS) if flags & (1 << bit))
+    if en_passant:
+        # The square the pawn that just moved skipped, behind it from the side to move
+        en_passant = Position(rank=3 if side_to_move == 'B' else 6, file=en_passant)
+    else:
+        en_passant = None
+    return PositionFields(pieces=pieces, side_to_move=side_to_move, castling_rights=castling_rights,
+                          en_passant=en_passant, halfmove_clock=halfmove_clock, fullmove_number=fullmove_number)
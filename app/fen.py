@@ -0,0 +1,97 @@
+from collections import namedtuple
+from .piece import Pieces as p
+from .position import Position
+from .rules import CASTLING_RIGHTS
+from .attacks import iter_squares
+
+
+"""
+
+Forsyth-Edwards Notation, for Board and BitBoard alike:
+
+    rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1
+
+Both boards are read and written through PositionFields, the position
+reduced to plain values, which app.encoding packs into bytes as well.
+
+"""
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# pieces being a list of (color, piece name, square), en_passant a Position or None
+PositionFields = namedtuple('PositionFields', ['pieces', 'side_to_move', 'castling_rights', 'en_passant',
+                                               'halfmove_clock', 'fullmove_number'])
+
+
+def parse_fen(fen):
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f"Not a FEN: {fen!r}")
+    rows = fields[0].split('/')
+    if len(rows) != 8:
+        raise ValueError(f"Not a FEN: {fen!r}")
+
+    pieces = []
+    for row, row_pieces in enumerate(rows):
+        file = 0
+        for char in row_pieces:
+            if char.isdigit():
+                file += int(char)
+                continue
+            if char.upper() not in 'PNBRQK' or file > 7:
+                raise ValueError(f"Not a FEN: {fen!r}")
+            pieces.append(('W' if char.isupper() else 'B', char.upper(), (7 - row) * 8 + file))
+            file += 1
+
+    castling_rights = ''.join(right for right in CASTLING_RIGHTS if right in fields[2])
+    en_passant = None if fields[3] == '-' else Position(rank=int(fields[3][1]), file=fields[3][0].upper())
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+    return PositionFields(pieces=pieces, side_to_move='W' if fields[1] == 'w' else 'B',
+                          castling_rights=castling_rights, en_passant=en_passant, halfmove_clock=halfmove_clock,
+                          fullmove_number=fullmove_number)
+
+
+def format_fen(fields):
+    letters = {square: name if color == 'W' else name.lower() for color, name, square in fields.pieces}
+    rows = []
+    for rank in range(7, -1, -1):
+        row = ''
+        empty = 0
+        for square in range(rank * 8, rank * 8 + 8):
+            if square in letters:
+                row += (str(empty) if empty else '') + letters[square]
+                empty = 0
+            else:
+                empty += 1
+        rows.append(row + (str(empty) if empty else ''))
+    en_passant = '-' if fields.en_passant is None else str(fields.en_passant).lower()
+    return f"{'/'.join(rows)} {fields.side_to_move.lower()} {fields.castling_rights or '-'} {en_passant} " \
+           f"{fields.halfmove_clock} {fields.fullmove_number}"
+
+
+def board_fields(board):
+    return PositionFields(pieces=[(color, name, square) for color in 'WB' for name, bb in board.pieces[color].items()
+                                  for square in iter_squares(bb)],
+                          side_to_move=board.side_to_move, castling_rights=board.castling_rights,
+                          en_passant=board.en_passant, halfmove_clock=board.halfmove_clock,
+                          fullmove_number=board.fullmove_number)
+
+
+def load_fields(board_class, fields):
+    """
+    A new board_class holding the position of fields
+    """
+    board = board_class(fill=False)
+    for color, name, square in fields.pieces:
+        board.set_piece(getattr(p, name)(position=Position.from_square(square), color=color))
+    board.side_to_move = fields.side_to_move
+    board.castling_rights = fields.castling_rights
+    board.en_passant = fields.en_passant
+    board.halfmove_clock = fields.halfmove_clock
+    board.fullmove_number = fields.fullmove_number
+    board.zobrist_key = board.compute_zobrist_key()
+    for color in 'WB':
+        king = board.king[color]
+        board.king_in_check[color] = king is not None and king.is_in_check(board)
+    return board
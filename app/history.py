@@ -0,0 +1,85 @@
+import time
+from collections import namedtuple
+from .movegen import Move
+
+
+"""
+
+Game history as a move log:
+
+    start position (encoded, see app.encoding) -> [HistoryEntry per move]
+
+Past positions are rebuilt on demand by replaying moves from the start, or
+from the nearest checkpoint when checkpoint_interval is set, every
+checkpoint being one more 30 byte encoded position. zobrist_key is the key
+after the move, so the keys of every position of the game are at hand
+without rebuilding any of them.
+
+"""
+
+HistoryEntry = namedtuple('HistoryEntry', ['move', 'captured', 'zobrist_key', 'timestamp'])
+
+
+class MoveHistory:
+    """
+    Moves played on a board since start, with the positions in between rebuilt lazily
+    """
+    def __init__(self, board_class, checkpoint_interval=None):
+        self.board_class = board_class
+        self.checkpoint_interval = checkpoint_interval
+        self.entries = []
+        self.checkpoints = {}
+        self.start_key = None
+        self.start_time = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def started(self):
+        return 0 in self.checkpoints
+
+    def start(self, board):
+        self.entries = []
+        self.checkpoints = {0: board.to_bytes()}
+        self.start_key = board.zobrist_key
+        self.start_time = time.time()
+
+    def record(self, board, move, captured=None):
+        """
+        Logs move, just played on board, captured being the name of the piece it took
+        """
+        self.entries.append(HistoryEntry(move=Move(*move), captured=captured, zobrist_key=board.zobrist_key,
+                                         timestamp=time.time()))
+        if self.checkpoint_interval and len(self.entries) % self.checkpoint_interval == 0:
+            self.checkpoints[len(self.entries)] = board.to_bytes()
+
+    @property
+    def keys(self):
+        # Zobrist key of every position of the game, the start position first
+        return [self.start_key] + [entry.zobrist_key for entry in self.entries]
+
+    def position(self, ply):
+        """
+        A new board holding the position after the first ply moves
+        """
+        if not 0 <= ply <= len(self.entries):
+            raise IndexError(ply)
+        checkpoint = max(checkpoint for checkpoint in self.checkpoints if checkpoint <= ply)
+        board = self.board_class.from_bytes(self.checkpoints[checkpoint])
+        for entry in self.entries[checkpoint:ply]:
+            board.make_move(*entry.move)
+        return board
+
+    def positions(self):
+        """
+        (ply, timestamp, board) for every position of the game in order. The one board is moved forward between
+        items, copy it to keep a position.
+        """
+        if not self.started:
+            return
+        board = self.board_class.from_bytes(self.checkpoints[0])
+        yield 0, self.start_time, board
+        for ply, entry in enumerate(self.entries, 1):
+            board.make_move(*entry.move)
+            yield ply, entry.timestamp, board
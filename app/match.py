@@ -0,0 +1,241 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing.util import Finalize
+import numpy as np
+from .board import Board
+from .chess import ChessGame
+from .draws import game_result
+from .fen import START_FEN
+from .movegen import Move
+from .perft import move_name
+from .pgn import san, format_pgn
+from .rules import is_promotion
+from .timeman import TimeManager
+
+
+"""
+
+Batch games between engine settings, or of one engine against itself:
+
+    python -m app.match --games 200 --concurrency 8 --movetime 0.5 --pgn games.pgn --jsonl games.jsonl
+    python -m app.match --games 100 --engine d2=2 --engine d4=4 --clock 60 --increment 1 --openings book.epd
+
+Every game runs in a worker process of its own with a ChessGame reused from
+game to game, so its search pool and transposition table are built once per
+worker. Finished games are appended to the PGN and JSONL files as they come
+in, nothing is kept in memory, and throughput is reported in games per hour.
+
+Game i plays opening i // 2 (cycling through the list) with the engines'
+colors swapped every second game, and seeds the tie-break between equal moves
+with seed + i, so a run is repeatable move for move at fixed depth.
+
+"""
+
+# name, max_depth and min_depth of get_best_move for one side
+Engine = namedtuple('Engine', ['name', 'max_depth', 'min_depth'])
+
+# movetime: seconds per move, or clock / increment: seconds per side and added after every move
+TimeControl = namedtuple('TimeControl', ['movetime', 'clock', 'increment'], defaults=[None, None, 0])
+
+# Search pool of this worker process, see _init_worker
+_game = None
+
+
+def _init_worker(search_workers, tt_size_mb, book=None):
+    global _game
+    _game = ChessGame(Board(snapshots=False), tt_size_mb=tt_size_mb, workers=search_workers, book=book)
+    # Workers end through os._exit, past the table's own finalizer, but multiprocessing's exit hooks still run
+    Finalize(None, _game.close, exitpriority=10)
+
+
+def play_game(game, board, engines, time_control, max_plies=400, time_manager=None):
+    """
+    Plays board to the end with engines[color] choosing the moves through game.get_best_move. Returns (result,
+    reason, moves), reason being None for a game stopped after max_plies
+    """
+    time_manager = time_manager or TimeManager()
+    remaining = dict.fromkeys('WB', time_control.clock)
+    moves = []
+
+    while len(moves) < max_plies:
+        result = game_result(board)
+        if result is not None:
+            return result[0], result[1], moves
+
+        color = board.side_to_move
+        engine = engines[color]
+        if time_control.clock is None:
+            soft_time = hard_time = time_control.movetime
+        else:
+            soft_time, hard_time = time_manager.allocate(remaining[color], time_control.increment)
+
+        move_start = time.time()
+        # get_best_move prints every root score
+        with contextlib.redirect_stdout(io.StringIO()):
+            (piece, to_position), _ = game.get_best_move(board, color, hard_time, engine.max_depth, engine.min_depth,
+                                                         soft_time=soft_time)
+        if time_control.clock is not None:
+            remaining[color] += time_control.increment - (time.time() - move_start)
+            if remaining[color] <= 0:
+                return ('0-1' if color == 'W' else '1-0'), 'time forfeit', moves
+
+        # Root moves leave promotions to the board's default, a queen
+        move = Move(piece.position, to_position, 'Q' if is_promotion(piece.name, to_position.square) else None)
+        moves.append(move)
+        board.move_piece(*move)
+    return '*', None, moves
+
+
+def _play(index, opening, engines, time_control, seed, max_plies):
+    np.random.seed((seed + index) % 2 ** 32)
+    _game.cache.clear()
+
+    board = Board.from_fen(opening)
+    start_board = Board.from_fen(opening)
+    fullmove_number, black_first = start_board.fullmove_number, start_board.side_to_move == 'B'
+    first, second = engines if index % 2 == 0 else engines[::-1]
+    sides = {board.side_to_move: first, 'B' if board.side_to_move == 'W' else 'W': second}
+
+    start_time = time.time()
+    result, reason, moves = play_game(_game, board, sides, time_control, max_plies)
+    seconds = time.time() - start_time
+
+    san_moves = []
+    for move in moves:
+        san_moves.append(san(start_board, move))
+        start_board.move_piece(*move)
+
+    tags = {
+        'Event': 'app.match',
+        'Site': '?',
+        'Date': time.strftime('%Y.%m.%d'),
+        'Round': str(index + 1),
+        'White': sides['W'].name,
+        'Black': sides['B'].name,
+        'Result': result,
+    }
+    if opening != START_FEN:
+        tags.update(SetUp='1', FEN=opening)
+    if reason is not None:
+        tags['Termination'] = reason
+    pgn = format_pgn(tags, san_moves, result, fullmove_number, black_first)
+
+    record = {
+        'game': index,
+        'white': sides['W'].name,
+        'black': sides['B'].name,
+        'opening': opening,
+        'seed': seed + index,
+        'result': result,
+        'reason': reason,
+        'plies': len(moves),
+        'seconds': seconds,
+        'moves': [move_name(move) for move in moves],
+    }
+    return pgn, record
+
+
+def run_match(n_games, engines, time_control, openings=(START_FEN,), concurrency=1, search_workers=1,
+              tt_size_mb=16, seed=0, max_plies=400, pgn_path=None, jsonl_path=None, report=print, book=None):
+    """
+    Plays n_games between the two engines (the same one twice for self-play), at most concurrency at a time,
+    appending each game to pgn_path and jsonl_path as it finishes. book is the path of an app.book file shared by
+    every worker. Returns {result: count, 'games_per_hour': ...}
+    """
+    engines = tuple(engines) * (2 if len(engines) == 1 else 1)
+    scores = {'1-0': 0, '0-1': 0, '1/2-1/2': 0, '*': 0}
+    start_time = time.time()
+    done = 0
+
+    with contextlib.ExitStack() as stack:
+        pgn_file = stack.enter_context(open(pgn_path, 'a')) if pgn_path else None
+        jsonl_file = stack.enter_context(open(jsonl_path, 'a')) if jsonl_path else None
+        executor = stack.enter_context(ProcessPoolExecutor(concurrency, initializer=_init_worker,
+                                                           initargs=(search_workers, tt_size_mb, book)))
+
+        # A bounded number of games in flight, so pending results never pile up
+        pending = set()
+        next_index = 0
+        while next_index < n_games or pending:
+            while next_index < n_games and len(pending) < 2 * concurrency:
+                opening = openings[(next_index // 2) % len(openings)]
+                pending.add(executor.submit(_play, next_index, opening, engines, time_control, seed, max_plies))
+                next_index += 1
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pgn, record = future.result()
+                if pgn_file is not None:
+                    pgn_file.write(pgn)
+                    pgn_file.flush()
+                if jsonl_file is not None:
+                    jsonl_file.write(json.dumps(record) + '\n')
+                    jsonl_file.flush()
+                scores[record['result']] += 1
+                done += 1
+                games_per_hour = done * 3600 / (time.time() - start_time)
+                report(f"game {record['game'] + 1}: {record['white']} - {record['black']} {record['result']} "
+                       f"({record['reason']}, {record['plies']} plies) | {done}/{n_games} games, "
+                       f"{games_per_hour:.1f} games/hour")
+
+    scores['games_per_hour'] = done * 3600 / (time.time() - start_time) if done else 0.
+    return scores
+
+
+def _engine(text, min_depth):
+    name, _, depth = text.partition('=')
+    return Engine(name=name, max_depth=int(depth or 3), min_depth=min(min_depth, int(depth or 3)))
+
+
+def load_openings(path):
+    # One FEN (or EPD, the move counters then default) per line
+    openings = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split(';')[0].split()
+            if len(fields) >= 4:
+                counters = fields[4:6] if len(fields) >= 6 and fields[4].isdigit() else ['0', '1']
+                openings.append(' '.join(fields[:4] + counters))
+    return openings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.match', description='Batch engine games')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--engine', action='append', default=None,
+                        help='name=max_depth, give two for a match, one (the default) for self-play')
+    parser.add_argument('--min-depth', type=int, default=1)
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument('--movetime', type=float, help='seconds per move (default 1)')
+    limit.add_argument('--clock', type=float, help='seconds per side')
+    parser.add_argument('--increment', type=float, default=0)
+    parser.add_argument('--openings', help='file of FEN/EPD lines, the start position when not given')
+    parser.add_argument('--concurrency', type=int, default=1, help='games played at once')
+    parser.add_argument('--search-workers', type=int, default=1, help='search pool size of every game')
+    parser.add_argument('--tt-size-mb', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-plies', type=int, default=400)
+    parser.add_argument('--book', help='opening book of app.book')
+    parser.add_argument('--pgn')
+    parser.add_argument('--jsonl')
+    args = parser.parse_args(argv)
+
+    engines = [_engine(text, args.min_depth) for text in args.engine or ['engine=3']]
+    if len(engines) > 2:
+        parser.error('at most two engines')
+    time_control = TimeControl(movetime=args.movetime or 1., clock=args.clock, increment=args.increment)
+    openings = load_openings(args.openings) if args.openings else [START_FEN]
+
+    scores = run_match(args.games, engines, time_control, openings, args.concurrency, args.search_workers,
+                       args.tt_size_mb, args.seed, args.max_plies, args.pgn, args.jsonl, book=args.book)
+    print(json.dumps(scores))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,178 @@
+from collections import namedtuple
+from .attacks import FULL, RANK_1, RANK_8, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, rook_attacks, \
+    bishop_attacks, queen_attacks, iter_squares
+from .position import Position
+from .rules import CASTLING_MOVES, CASTLING_ROOK_SQUARES, PROMOTION_PIECES
+
+
+"""
+
+Strictly legal move generation for any board keeping the bitboard view:
+
+    board.pieces[color][name], board.occupied[color], board.castling_rights, board.en_passant
+
+Checkers, pinned pieces and their pin rays are worked out once per position,
+then every piece's targets are masked by them, so nothing is played on the
+board to test for check.
+
+"""
+
+Move = namedtuple('Move', ['from_position', 'to_position', 'promotion'], defaults=[None])
+
+
+def _invert_color(color):
+    if color == 'W':
+        return 'B'
+    return 'W'
+
+
+def attackers_to(board, square, by_color, occupied):
+    attacker = board.pieces[by_color]
+    return (KNIGHT_ATTACKS[square] & attacker['N']) | (KING_ATTACKS[square] & attacker['K']) | \
+        (PAWN_ATTACKS[_invert_color(by_color)][square] & attacker['P']) | \
+        (rook_attacks(square, occupied) & (attacker['R'] | attacker['Q'])) | \
+        (bishop_attacks(square, occupied) & (attacker['B'] | attacker['Q']))
+
+
+def is_square_attacked(board, square, by_color):
+    return bool(attackers_to(board, square, by_color, board.occupied['W'] | board.occupied['B']))
+
+
+def attacked_squares(board, by_color, occupied):
+    attacker = board.pieces[by_color]
+    attacks = 0
+    for square in iter_squares(attacker['P']):
+        attacks |= PAWN_ATTACKS[by_color][square]
+    for square in iter_squares(attacker['N']):
+        attacks |= KNIGHT_ATTACKS[square]
+    for square in iter_squares(attacker['B']):
+        attacks |= bishop_attacks(square, occupied)
+    for square in iter_squares(attacker['R']):
+        attacks |= rook_attacks(square, occupied)
+    for square in iter_squares(attacker['Q']):
+        attacks |= queen_attacks(square, occupied)
+    for square in iter_squares(attacker['K']):
+        attacks |= KING_ATTACKS[square]
+    return attacks
+
+
+def _pin_rays(board, king_square, color, occupied):
+    # pinned square -> squares it may still move to: the ray between king and pinner, pinner included
+    enemy = board.pieces[_invert_color(color)]
+    own = board.occupied[color]
+    them = board.occupied[_invert_color(color)]
+    pins = {}
+    snipers = (rook_attacks(king_square, them) & (enemy['R'] | enemy['Q'])) | \
+        (bishop_attacks(king_square, them) & (enemy['B'] | enemy['Q']))
+    for sniper in iter_squares(snipers):
+        between = BETWEEN[king_square][sniper]
+        blockers = between & occupied
+        if blockers and not blockers & (blockers - 1) and blockers & own:
+            pins[blockers.bit_length() - 1] = between | (1 << sniper)
+    return pins
+
+
+def _add_moves(moves, from_square, targets):
+    from_position = Position.from_square(from_square)
+    for to_square in iter_squares(targets):
+        moves.append(Move(from_position, Position.from_square(to_square)))
+
+
+def _add_pawn_moves(moves, from_square, targets):
+    from_position = Position.from_square(from_square)
+    for to_square in iter_squares(targets):
+        to_position = Position.from_square(to_square)
+        if to_square < 8 or to_square >= 56:
+            for promotion in PROMOTION_PIECES:
+                moves.append(Move(from_position, to_position, promotion))
+        else:
+            moves.append(Move(from_position, to_position))
+
+
+def _en_passant_is_legal(board, color, from_square, to_square, king_square, occupied):
+    # Two pawns leave the same rank at once, so test the resulting position for slider attacks on the king
+    captured_square = to_square - 8 if color == 'W' else to_square + 8
+    occupied = (occupied ^ (1 << from_square) ^ (1 << captured_square)) | (1 << to_square)
+    enemy = board.pieces[_invert_color(color)]
+    return not (rook_attacks(king_square, occupied) & (enemy['R'] | enemy['Q'])) and \
+        not (bishop_attacks(king_square, occupied) & (enemy['B'] | enemy['Q']))
+
+
+def generate_legal_moves(board, color=None, from_position=None, captures_only=False):
+    """
+    Returns every legal Move for color (the side to move by default), only those of the piece on from_position
+    when given. With captures_only, only captures and promotions, the moves quiescence search looks at.
+    """
+    color = color or board.side_to_move
+    enemy_color = _invert_color(color)
+    own = board.pieces[color]
+    us = board.occupied[color]
+    them = board.occupied[enemy_color]
+    occupied = us | them
+    only = FULL if from_position is None else 1 << from_position.square
+    # Pawns reaching the last rank count as tactical moves even without a capture
+    wanted = them if captures_only else FULL
+    last_rank = RANK_8 if color == 'W' else RANK_1
+    moves = []
+
+    if not own['K']:
+        return moves
+    king_square = own['K'].bit_length() - 1
+
+    checkers = attackers_to(board, king_square, enemy_color, occupied)
+
+    if only & own['K']:
+        # The king itself must not shadow the squares behind it from a slider checking it
+        danger = attacked_squares(board, enemy_color, occupied ^ own['K'])
+        _add_moves(moves, king_square, KING_ATTACKS[king_square] & ~us & ~danger & wanted)
+
+        if not checkers and not captures_only:
+            for right in board.castling_rights:
+                king_from, king_to, empty, path = CASTLING_MOVES[right]
+                rook_from = CASTLING_ROOK_SQUARES[king_to][0]
+                if right.isupper() == (color == 'W') and king_from == king_square and own['R'] & (1 << rook_from) \
+                        and not occupied & empty and not any(danger & (1 << square) for square in path):
+                    _add_moves(moves, king_square, 1 << king_to)
+
+    # Double check: only the king may move
+    if checkers & (checkers - 1):
+        return moves
+
+    if checkers:
+        check_mask = checkers | BETWEEN[king_square][checkers.bit_length() - 1]
+    else:
+        check_mask = FULL
+    pins = _pin_rays(board, king_square, color, occupied)
+
+    for name in 'NBRQ':
+        for square in iter_squares(own[name] & only):
+            if name == 'N':
+                targets = KNIGHT_ATTACKS[square]
+            elif name == 'B':
+                targets = bishop_attacks(square, occupied)
+            elif name == 'R':
+                targets = rook_attacks(square, occupied)
+            else:
+                targets = queen_attacks(square, occupied)
+            _add_moves(moves, square, targets & ~us & check_mask & pins.get(square, FULL) & wanted)
+
+    step = 8 if color == 'W' else -8
+    start_rank = 1 if color == 'W' else 6
+    en_passant = None if board.en_passant is None else board.en_passant.square
+    for square in iter_squares(own['P'] & only):
+        pin = pins.get(square, FULL)
+        targets = PAWN_ATTACKS[color][square] & them
+        one = square + step
+        if not occupied & (1 << one):
+            targets |= 1 << one
+            if square // 8 == start_rank and not occupied & (1 << (one + step)):
+                targets |= 1 << (one + step)
+        _add_pawn_moves(moves, square, targets & check_mask & pin & (wanted | last_rank))
+
+        if en_passant is not None and PAWN_ATTACKS[color][square] & (1 << en_passant) & pin:
+            # Also legal when the pawn taken en passant is the one giving check
+            if (check_mask & ((1 << en_passant) | (1 << (en_passant - step)))) and \
+                    _en_passant_is_legal(board, color, square, en_passant, king_square, occupied):
+                _add_moves(moves, square, 1 << en_passant)
+
+    return moves
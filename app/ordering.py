@@ -0,0 +1,85 @@
+from .piece import Pieces as p
+from .tt import encode_move
+
+
+"""
+
+Move ordering for alpha-beta, best candidates first:
+
+    hash move -> captures by MVV-LVA -> killer moves of the ply -> quiet moves by history
+
+Killers and history live for the whole search in one process, so a pool
+worker keeps them across the root moves and iterations it searches.
+
+"""
+
+HASH_MOVE = 3
+CAPTURE = 2
+KILLER = 1
+QUIET = 0
+
+
+class MoveOrderer:
+    """
+    Sorts (from_position, to_position[, promotion]) moves and learns from beta cutoffs
+    """
+    def __init__(self, n_killers=2):
+        self.n_killers = n_killers
+        self.killers = {}
+        self.history = {}
+        self.search_id = None
+
+    def new_search(self, search_id):
+        # Killers are tied to plies of one search tree, history only fades
+        if search_id != self.search_id:
+            self.search_id = search_id
+            self.killers = {}
+            self.history = {key: value // 2 for key, value in self.history.items() if value > 1}
+
+    @staticmethod
+    def _victim_score(board, move):
+        # Value gained by the move itself: the captured piece, the pawn taken en passant or a promotion
+        from_position, to_position = move[0], move[1]
+        victim = board[to_position]
+        if victim is not None:
+            score = victim.score
+        elif board.en_passant is not None and to_position == board.en_passant and board[from_position].name == 'P':
+            score = 1
+        else:
+            score = 0
+        if len(move) > 2 and move[2] is not None:
+            score += getattr(p, move[2]).score
+        return score
+
+    def _sort_key(self, board, move, killers, hash_move, color):
+        encoded = encode_move(*move)
+        if encoded == hash_move:
+            return HASH_MOVE, 0
+        victim_score = self._victim_score(board, move)
+        if victim_score:
+            # Most valuable victim first, then least valuable attacker
+            return CAPTURE, victim_score * 1000 - board[move[0]].score
+        if encoded in killers:
+            return KILLER, -killers.index(encoded)
+        return QUIET, self.history.get((color, encoded), 0)
+
+    def order(self, board, moves, ply, hash_move=0):
+        if not moves:
+            return moves
+        killers = self.killers.get(ply, [])
+        color = board[moves[0][0]].color
+        return sorted(moves, key=lambda move: self._sort_key(board, move, killers, hash_move, color), reverse=True)
+
+    def update(self, board, move, ply, depth):
+        """
+        Records a move that caused a beta cutoff, searched with depth plies left
+        """
+        if self._victim_score(board, move):
+            return
+        encoded = encode_move(*move)
+        killers = self.killers.setdefault(ply, [])
+        if encoded not in killers:
+            killers.insert(0, encoded)
+            del killers[self.n_killers:]
+        key = (board[move[0]].color, encoded)
+        self.history[key] = self.history.get(key, 0) + depth * depth
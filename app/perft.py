@@ -0,0 +1,136 @@
+import argparse
+import time
+from collections import namedtuple
+from multiprocessing.pool import Pool
+from .board import Board
+from .bitboard import BitBoard
+from .movegen import generate_legal_moves
+from .fen import START_FEN
+
+
+"""
+
+Perft: counts the leaf nodes of the legal move tree to a fixed depth, the
+standard check of a move generator against known counts and a measure of its
+speed.
+
+    python -m app.perft --depth 4
+    python -m app.perft --fen "<fen>" --depth 3 --divide --workers 4
+    python -m app.perft --suite --depth 3 --bitboard
+
+Divide breaks the count down per root move, to find the move whose subtree
+goes wrong by comparing against another engine.
+
+"""
+
+# (name, fen, leaf counts for depth 1, 2, ...), from the Chess Programming Wiki perft results
+REFERENCE_POSITIONS = [
+    ('startpos', START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+PerftResult = namedtuple('PerftResult', ['nodes', 'seconds', 'nps', 'divide'])
+
+
+def move_name(move):
+    # Coordinate notation, e2e4 or e7e8q
+    return f"{move.from_position}{move.to_position}{move.promotion or ''}".lower()
+
+
+def perft(board, depth):
+    """
+    Leaf nodes of the legal move tree depth plies below board
+    """
+    moves = generate_legal_moves(board)
+    if depth <= 1:
+        # Bulk counting: the last ply is not played
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = board.make_move(*move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move(undo)
+    return nodes
+
+
+def _divide_task(args):
+    board, move, depth = args
+    board.make_move(*move)
+    return move_name(move), perft(board, depth - 1)
+
+
+def run_perft(board, depth, divide=False, workers=None):
+    """
+    Perft from board, serially or with the root moves spread over a pool of worker processes. With divide, the
+    result also holds the count under every root move.
+    """
+    start_time = time.time()
+    moves = generate_legal_moves(board)
+    if depth < 1:
+        counts = {}
+        nodes = 1
+    elif workers and workers > 1:
+        with Pool(workers) as pool:
+            counts = dict(pool.imap_unordered(_divide_task, [(board.copy(), move, depth) for move in moves]))
+        nodes = sum(counts.values())
+    elif divide:
+        counts = dict(_divide_task((board.copy(), move, depth)) for move in moves)
+        nodes = sum(counts.values())
+    else:
+        counts = {}
+        nodes = perft(board, depth)
+    seconds = time.time() - start_time
+    return PerftResult(nodes=nodes, seconds=seconds, nps=nodes / seconds if seconds > 0 else 0.,
+                       divide=dict(sorted(counts.items())) if divide else None)
+
+
+def run_suite(depth, board_class=Board, workers=None):
+    """
+    Perft of every reference position with a known count, to depth plies at most. Returns
+    {name: (expected, PerftResult)}
+    """
+    results = {}
+    for name, fen, counts in REFERENCE_POSITIONS:
+        position_depth = min(depth, len(counts))
+        result = run_perft(board_class.from_fen(fen), position_depth, workers=workers)
+        results[name] = counts[position_depth - 1], result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.perft', description='Perft move generator check')
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help='count per root move')
+    parser.add_argument('--workers', type=int, default=None, help='pool size, serial when not given')
+    parser.add_argument('--bitboard', action='store_true', help='use BitBoard instead of Board')
+    parser.add_argument('--suite', action='store_true', help='check every reference position')
+    args = parser.parse_args(argv)
+    board_class = BitBoard if args.bitboard else Board
+
+    if args.suite:
+        failed = 0
+        for name, (expected, result) in run_suite(args.depth, board_class, args.workers).items():
+            status = 'ok' if result.nodes == expected else 'FAILED'
+            failed += result.nodes != expected
+            print(f"{name:<10} {result.nodes:>10} / {expected:<10} {result.seconds:8.2f}s {result.nps:10.0f} nps "
+                  f"{status}")
+        return 1 if failed else 0
+
+    result = run_perft(board_class.from_fen(args.fen), args.depth, args.divide, args.workers)
+    if result.divide is not None:
+        for name, nodes in result.divide.items():
+            print(f"{name}: {nodes}")
+        print()
+    print(f"nodes {result.nodes} time {result.seconds:.2f}s nps {result.nps:.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+from .movegen import generate_legal_moves
+from .rules import is_castling
+
+
+"""
+
+Portable Game Notation: standard algebraic moves (Nf3, exd5, e8=Q+, O-O)
+and the game text around them.
+
+"""
+
+
+def san(board, move):
+    """
+    move in standard algebraic notation, board being the position before it
+    """
+    piece = board[move.from_position]
+    to_square = move.to_position.square
+    if is_castling(piece.name, move.from_position.square, to_square):
+        text = 'O-O' if to_square % 8 == 6 else 'O-O-O'
+    else:
+        capture = board[move.to_position] is not None or (piece.name == 'P' and move.to_position == board.en_passant)
+        destination = str(move.to_position).lower()
+        if piece.name == 'P':
+            text = (str(move.from_position)[0].lower() + 'x' if capture else '') + destination
+            if move.promotion is not None:
+                text += '=' + move.promotion
+        else:
+            # Tell apart other pieces of the same kind reaching the same square, by file, then rank, then both
+            others = [other.from_position for other in generate_legal_moves(board, piece.color)
+                      if other.to_position == move.to_position and other.from_position != move.from_position
+                      and board[other.from_position].name == piece.name]
+            origin = str(move.from_position).lower()
+            if not others:
+                prefix = ''
+            elif all(other.file != move.from_position.file for other in others):
+                prefix = origin[0]
+            elif all(other.rank != move.from_position.rank for other in others):
+                prefix = origin[1]
+            else:
+                prefix = origin
+            text = piece.name + prefix + ('x' if capture else '') + destination
+
+    undo = board.make_move(*move)
+    color = board.side_to_move
+    if board.king_in_check[color]:
+        text += '+' if generate_legal_moves(board, color) else '#'
+    board.unmake_move(undo)
+    return text
+
+
+def format_pgn(tags, san_moves, result, fullmove_number=1, black_first=False):
+    """
+    PGN text of one game: tags (name -> value, Seven Tag Roster order is up to the caller), its moves in SAN and
+    its result
+    """
+    lines = [f'[{name} "{value}"]' for name, value in tags.items()]
+    lines.append('')
+
+    words = []
+    number = fullmove_number
+    white_to_move = not black_first
+    if black_first and san_moves:
+        words.append(f"{number}...")
+    for text in san_moves:
+        if white_to_move:
+            words.append(f"{number}.")
+        else:
+            number += 1
+        words.append(text)
+        white_to_move = not white_to_move
+    words.append(result)
+
+    line = ''
+    for word in words:
+        if line and len(line) + 1 + len(word) > 79:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
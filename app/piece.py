@@ -1,8 +1,7 @@
 from .position import Position
-from functools import lru_cache
-from .moves import get_left_moves, get_right_moves, get_forward_moves, get_backward_moves,\
-    get_backward_left_diagonal_moves, get_backward_right_diagonal_moves, get_forward_left_diagonal_moves, \
-    get_forward_right_diagonal_moves
+from .movegen import generate_legal_moves
+from .attacks import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, queen_attacks, \
+    iter_squares
 
 name_hash = {
     'E': 1,
@@ -20,17 +19,29 @@ color_hash = {
 }
 
 
+def _to_positions(bb):
+    return {Position.from_square(square) for square in iter_squares(bb)}
+
+
 class Piece:
     """
-    Abstract class for a chess piece
+    Abstract class for a chess piece. Only color and position belong to an instance, name, icons and score are
+    shared by every piece of a type.
     """
-    def __init__(self, position, color=None, name='E', icon='.', score=0):
+    __slots__ = ('color', 'position')
+
+    name = 'E'
+    score = 0
+    white_icon = '.'
+    black_icon = '.'
+
+    def __init__(self, position, color=None):
         self.color = color
-        self.name = name
         self.position = position
-        # self.history = []
-        self.score = score
-        self.icon = icon
+
+    @property
+    def icon(self):
+        return self.black_icon if self.color == 'B' else self.white_icon
 
     def __hash__(self):
         return (self.position.__hash__() + (100 * name_hash[self.name])) * color_hash[self.color]
@@ -39,9 +50,7 @@ class Piece:
         return self.__hash__() == other.__hash__()
 
     def copy(self):
-        return type(self)(position=Position(rank=self.position.rank,
-                                            file=self.position.file),
-                          color=self.color)
+        return type(self)(position=self.position, color=self.color)
 
     def __repr__(self):
         return f" {self.icon} "
@@ -51,120 +60,59 @@ class Piece:
         # TODO - config based moves
         raise NotImplementedError
 
-    @lru_cache(maxsize=100)
     def get_legal_moves(self, board):
-        # TODO - King castles
-        # TODO - Pawn - en passant
-        # TODO - Pawn to 8th rank promotes
-
-        legal_moves = set()
-
-        moves = self.get_moves(board) - {self.position}
-        # king_pos = board.king[self.color].position
-        # attacked_positions = board.get_attacked_positions(self.color)
-        # king_in_check = board.king[self.color].is_in_check(board)
-
-        # check for pins/check if king in check and if we can block/take
-
-        for move in moves:
-            board_copy = board.copy()
-            board_copy.move_piece(self.position, move)
-            if not board_copy.king_in_check[self.color]:
-                legal_moves.add(move)
-
-        # for piece, attacked_path in attacked_positions.items():
-        #     if self.position in attacked_path:
-        #         if not king_in_check:
-        #             board_copy = board.copy()
-        #             del board_copy.board[self.position]
-        #             if board_copy.king[self.color].is_in_check(board_copy):
-        #                 return set()
-
-        # check if king in check and if we can block/take
-        # if king_in_check:
-        #     for piece, attacked_path in attacked_positions.items():
-        #         if king_pos in attacked_path:
-        #             # Check if can block
-        #             possible_blocks = moves.intersection(attacked_path)
-        #             blocks = set()
-        #             for block in possible_blocks:
-        #                 board_copy = board.copy()
-        #                 board_copy.move_piece(self.position, block)
-        #                 if not board_copy.king[self.color].is_in_check(board_copy):
-        #                     blocks.add(block)
-        #
-        #             if len(blocks) > 0:
-        #                 legal_moves.update(blocks)
-        #
-        #             # Check if can take
-        #             legal_moves.update(moves.intersection({piece.position}))
-        #
-        #     return legal_moves
-
-        return legal_moves
+        # Promotions collapse onto their destination square
+        return {move.to_position for move in generate_legal_moves(board, self.color, self.position)}
 
     def get_attacked_positions(self, board):
         # Returns positions where king cannot move
         return self.get_moves(board)
 
     def move(self, position):
-        # self.history.append(self.position)
         self.position = position
 
 
 class Knight(Piece):
+    __slots__ = ()
+
+    name = 'N'
+    score = 3
+    white_icon = '♘'
+    black_icon = '♞'
+
     def __init__(self, position, color='W'):
-        if color == 'W':
-            icon = '♘'
-        else:
-            icon = '♞'
-        super(Knight, self).__init__(position=position, color=color, name='N', icon=icon, score=3)
+        super(Knight, self).__init__(position=position, color=color)
 
     def get_moves(self, board):
-        moves = set()
-        forward_backward_moves = []
-        forward_backward_moves.extend(get_forward_moves(self.position, 2, self.color, board, is_not_knight=False))
-        forward_backward_moves.extend(get_backward_moves(self.position, 2, self.color, board, is_not_knight=False))
-        for position in forward_backward_moves:
-            moves.update(get_left_moves(position, 1, self.color, board))
-            moves.update(get_right_moves(position, 1, self.color, board))
+        return _to_positions(KNIGHT_ATTACKS[self.position.square] & ~board.occupied[self.color])
 
-        left_right_moves = []
-        left_right_moves.extend(get_left_moves(self.position, 2, self.color, board, is_not_knight=False))
-        left_right_moves.extend(get_right_moves(self.position, 2, self.color, board, is_not_knight=False))
-        for position in left_right_moves:
-            moves.update(get_forward_moves(position, 1, self.color, board))
-            moves.update(get_backward_moves(position, 1, self.color, board))
 
-        return moves
+class Rook(Piece):
+    __slots__ = ()
 
+    name = 'R'
+    score = 5
+    white_icon = '♖'
+    black_icon = '♜'
 
-class Rook(Piece):
     def __init__(self, position, color='W'):
-        if color == 'W':
-            icon = '♖'
-        else:
-            icon = '♜'
-        super(Rook, self).__init__(position=position, color=color, name='R', icon=icon, score=5)
+        super(Rook, self).__init__(position=position, color=color)
 
     def get_moves(self, board):
-        moves = set()
+        occupied = board.occupied['W'] | board.occupied['B']
+        return _to_positions(rook_attacks(self.position.square, occupied) & ~board.occupied[self.color])
 
-        moves.update(get_forward_moves(self.position, 8, self.color, board))
-        moves.update(get_backward_moves(self.position, 8, self.color, board))
-        moves.update(get_left_moves(self.position, 8, self.color, board))
-        moves.update(get_right_moves(self.position, 8, self.color, board))
 
-        return moves
+class Pawn(Piece):
+    __slots__ = ()
 
+    name = 'P'
+    score = 1
+    white_icon = '♙'
+    black_icon = '♟'
 
-class Pawn(Piece):
     def __init__(self, position, color='W'):
-        if color == 'W':
-            icon = '♙'
-        else:
-            icon = '♟'
-        super(Pawn, self).__init__(position=position, color=color, name='P', icon=icon, score=1)
+        super(Pawn, self).__init__(position=position, color=color)
 
     def get_moves(self, board):
         # Pawn moves:
@@ -172,100 +120,76 @@ class Pawn(Piece):
         #   Forward 2 step when at 2nd/7th rank
         #   Moves diagonally
 
-        moves = set()
+        square = self.position.square
+        occupied = board.occupied['W'] | board.occupied['B']
+        step = 8 if self.color == 'W' else -8
 
-        # 1 step fwd
-        moves.update(get_forward_moves(self.position, 1, self.color, board, is_pawn=True))
+        # 1 step fwd diagonal, only onto an opponent piece
+        moves = PAWN_ATTACKS[self.color][square] & board.occupied['B' if self.color == 'W' else 'W']
 
-        # 1 step fwd diagonal
-        moves.update(get_forward_right_diagonal_moves(self.position, 1, self.color, board))
-        moves.update(get_forward_left_diagonal_moves(self.position, 1, self.color, board))
+        # 1 step fwd
+        if 0 <= square + step < 64 and not occupied & (1 << (square + step)):
+            moves |= 1 << (square + step)
 
-        # 2 step fwd
-        if (self.color == 'W' and self.position.rank == 2) or (self.color == 'B' and self.position.rank == 7):
-            moves.update(get_forward_moves(self.position, 2, self.color, board, is_pawn=True))
+            # 2 step fwd
+            if (self.color == 'W' and self.position.rank == 2) or (self.color == 'B' and self.position.rank == 7):
+                if not occupied & (1 << (square + 2 * step)):
+                    moves |= 1 << (square + 2 * step)
 
-        return moves
+        return _to_positions(moves)
 
     def get_attacked_positions(self, board):
-        positions = set()
-        positions.update(get_forward_right_diagonal_moves(self.position, 1, self.color, board, is_for_attack=True))
-        positions.update(get_forward_left_diagonal_moves(self.position, 1, self.color, board, is_for_attack=True))
-        return positions
+        return _to_positions(PAWN_ATTACKS[self.color][self.position.square] & ~board.occupied[self.color])
 
 
 class Bishop(Piece):
+    __slots__ = ()
+
+    name = 'B'
+    score = 3
+    white_icon = '♗'
+    black_icon = '♝'
+
     def __init__(self, position, color='W'):
-        if color == 'W':
-            icon = '♗'
-        else:
-            icon = '♝'
-        super(Bishop, self).__init__(position=position, color=color, name='B', icon=icon, score=3)
+        super(Bishop, self).__init__(position=position, color=color)
 
     def get_moves(self, board):
-        moves = set()
+        occupied = board.occupied['W'] | board.occupied['B']
+        return _to_positions(bishop_attacks(self.position.square, occupied) & ~board.occupied[self.color])
 
-        moves.update(get_forward_right_diagonal_moves(self.position, 8, self.color, board))
-        moves.update(get_forward_left_diagonal_moves(self.position, 8, self.color, board))
-        moves.update(get_backward_right_diagonal_moves(self.position, 8, self.color, board))
-        moves.update(get_backward_left_diagonal_moves(self.position, 8, self.color, board))
 
-        return moves
+class Queen(Piece):
+    __slots__ = ()
 
+    name = 'Q'
+    score = 9
+    white_icon = '♕'
+    black_icon = '♛'
 
-class Queen(Piece):
     def __init__(self, position, color='W'):
-        if color == 'W':
-            icon = '♕'
-        else:
-            icon = '♛'
-        super(Queen, self).__init__(position=position, color=color, name='Q', icon=icon, score=9)
+        super(Queen, self).__init__(position=position, color=color)
 
     def get_moves(self, board):
-        moves = set()
+        occupied = board.occupied['W'] | board.occupied['B']
+        return _to_positions(queen_attacks(self.position.square, occupied) & ~board.occupied[self.color])
 
-        moves.update(get_forward_moves(self.position, 8, self.color, board))
-        moves.update(get_backward_moves(self.position, 8, self.color, board))
-        moves.update(get_left_moves(self.position, 8, self.color, board))
-        moves.update(get_right_moves(self.position, 8, self.color, board))
-        moves.update(get_forward_right_diagonal_moves(self.position, 8, self.color, board))
-        moves.update(get_forward_left_diagonal_moves(self.position, 8, self.color, board))
-        moves.update(get_backward_right_diagonal_moves(self.position, 8, self.color, board))
-        moves.update(get_backward_left_diagonal_moves(self.position, 8, self.color, board))
 
-        return moves
+class King(Piece):
+    __slots__ = ()
 
+    name = 'K'
+    score = 100
+    white_icon = '♔'
+    black_icon = '♚'
 
-class King(Piece):
     def __init__(self, position, color='W'):
-        if color == 'W':
-            icon = '♔'
-        else:
-            icon = '♚'
-        super(King, self).__init__(position=position, color=color, name='K', icon=icon, score=100)
+        super(King, self).__init__(position=position, color=color)
 
     def get_moves(self, board):
-        moves = set()
-
-        moves.update(get_forward_moves(self.position, 1, self.color, board))
-        moves.update(get_backward_moves(self.position, 1, self.color, board))
-        moves.update(get_left_moves(self.position, 1, self.color, board))
-        moves.update(get_right_moves(self.position, 1, self.color, board))
-        moves.update(get_forward_right_diagonal_moves(self.position, 1, self.color, board))
-        moves.update(get_forward_left_diagonal_moves(self.position, 1, self.color, board))
-        moves.update(get_backward_right_diagonal_moves(self.position, 1, self.color, board))
-        moves.update(get_backward_left_diagonal_moves(self.position, 1, self.color, board))
-
-        return moves
+        return _to_positions(KING_ATTACKS[self.position.square] & ~board.occupied[self.color])
 
     def is_in_check(self, board):
-        attacked_positions = board.get_attacked_positions(self.color)
-
-        for piece, attacked_path in attacked_positions.items():
-            if self.position in attacked_path:
-                return True
-
-        return False
+        return board.is_attacked(self.position.square, 'B' if self.color == 'W' else 'W')
 
 
 class Pieces:
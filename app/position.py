@@ -23,12 +23,35 @@ rev_file_map = {
 
 
 class Position:
-    def __init__(self, rank, file):
+    """
+    A square of the board. There are only 64 instances, built once, so Position(rank, file) and
+    Position.from_square(square) hand back the same immutable object for the same square.
+    """
+    __slots__ = ('rank', 'file', 'square')
+
+    def __new__(cls, rank, file):
         if rank is None or file is None:
             raise ValueError
+        file = rev_file_map.get(file, file)
+        if not (1 <= rank <= 8 and 1 <= file <= 8):
+            raise ValueError
+        return _POSITIONS[(rank - 1) * 8 + (file - 1)]
+
+    @classmethod
+    def _build(cls, square):
+        position = object.__new__(cls)
+        object.__setattr__(position, 'rank', square // 8 + 1)
+        object.__setattr__(position, 'file', square % 8 + 1)
+        # 0 (A1) .. 63 (H8), the bit index used by bitboards
+        object.__setattr__(position, 'square', square)
+        return position
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Position is immutable')
 
-        self.rank = rank
-        self.file = rev_file_map.get(file, file)
+    def __reduce__(self):
+        # Unpickled and deep copied positions are the interned ones too
+        return Position.from_square, (self.square,)
 
     def __repr__(self):
 
@@ -44,4 +67,11 @@ class Position:
         return f"{self.file}{self.rank}" < f"{other.file.file}{other.rank}"
 
     def __eq__(self, other):
-        return self.file == other.file and self.rank == other.rank
+        return self is other
+
+    @classmethod
+    def from_square(cls, square):
+        return _POSITIONS[square]
+
+
+_POSITIONS = tuple(Position._build(square) for square in range(64))
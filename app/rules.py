@@ -0,0 +1,61 @@
+"""
+
+Castling and en-passant bookkeeping shared by Board and BitBoard.
+
+Castling rights use the FEN letters: K/Q white king/queen side, k/q black.
+
+"""
+
+CASTLING_RIGHTS = 'KQkq'
+
+# A move from or onto one of these squares drops the listed rights
+_CASTLING_RIGHTS_LOST = {
+    4: 'KQ',
+    7: 'K',
+    0: 'Q',
+    60: 'kq',
+    63: 'k',
+    56: 'q'
+}
+
+
+def update_castling_rights(castling_rights, from_square, to_square):
+    for square in (from_square, to_square):
+        lost = _CASTLING_RIGHTS_LOST.get(square)
+        if lost:
+            castling_rights = ''.join(right for right in castling_rights if right not in lost)
+    return castling_rights
+
+
+def en_passant_square(name, from_square, to_square):
+    # Square skipped by a pawn double push, None for any other move
+    if name == 'P' and abs(to_square - from_square) == 16:
+        return (from_square + to_square) // 2
+    return None
+
+
+# Castling right -> (king from, king to, squares that must be empty, squares the king must not be attacked on)
+CASTLING_MOVES = {
+    'K': (4, 6, (1 << 5) | (1 << 6), (4, 5, 6)),
+    'Q': (4, 2, (1 << 1) | (1 << 2) | (1 << 3), (4, 3, 2)),
+    'k': (60, 62, (1 << 61) | (1 << 62), (60, 61, 62)),
+    'q': (60, 58, (1 << 57) | (1 << 58) | (1 << 59), (60, 59, 58))
+}
+
+# King destination when castling -> (rook from, rook to)
+CASTLING_ROOK_SQUARES = {
+    6: (7, 5),
+    2: (0, 3),
+    62: (63, 61),
+    58: (56, 59)
+}
+
+PROMOTION_PIECES = 'QRBN'
+
+
+def is_castling(name, from_square, to_square):
+    return name == 'K' and abs(to_square - from_square) == 2
+
+
+def is_promotion(name, to_square):
+    return name == 'P' and (to_square < 8 or to_square >= 56)
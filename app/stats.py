@@ -0,0 +1,122 @@
+import json
+import time
+
+
+"""
+
+Search statistics.
+
+Every process counts into a plain dict of its own, new_counters(), with no
+locking: a pool worker zeroes it at the start of a root move task and hands a
+copy back with the move's score, and the parent adds the copies up in a
+SearchStats. Counting a node is one dict increment, the timers only run when
+profiling is asked for, see timed.
+
+    nodes / qnodes           positions searched by _alphabeta / _quiescence
+    tt_probes / tt_hits      table lookups and entries found
+    tt_cutoffs               nodes answered by the table alone
+    null_cutoffs             nodes cut by a null move
+    beta_cutoffs             nodes cut by a move, cutoff_index counting the
+                             index of that move (the last slot gathers the rest)
+    movegen_time             seconds in legal move generation, legality included
+    evaluation_time          seconds in static evaluation
+
+"""
+
+COUNTERS = ['nodes', 'qnodes', 'tt_probes', 'tt_hits', 'tt_cutoffs', 'null_cutoffs', 'beta_cutoffs']
+TIMERS = ['movegen_time', 'evaluation_time']
+CUTOFF_SLOTS = 8
+
+
+def new_counters():
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update(dict.fromkeys(TIMERS, 0.))
+    counters['cutoff_index'] = [0] * CUTOFF_SLOTS
+    return counters
+
+
+def reset_counters(counters):
+    # In place: the search holds on to the dict
+    for key in COUNTERS:
+        counters[key] = 0
+    for key in TIMERS:
+        counters[key] = 0.
+    counters['cutoff_index'][:] = [0] * CUTOFF_SLOTS
+
+
+def copy_counters(counters):
+    counters = dict(counters)
+    counters['cutoff_index'] = list(counters['cutoff_index'])
+    return counters
+
+
+def timed(function, counters, timer):
+    """
+    function, adding the seconds spent in every call to counters[timer]
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counters[timer] += time.perf_counter() - start
+    return wrapper
+
+
+class SearchStats:
+    """
+    Counts of one get_best_move, summed over every pool worker, with the depth reached and the time and nodes at the
+    end of every completed iteration
+    """
+    def __init__(self):
+        self.counters = new_counters()
+        self.depth = 0
+        self.depth_times = []
+        self.depth_nodes = []
+        self.book = False
+        self.start_time = time.time()
+        self.seconds = 0.
+
+    def __getitem__(self, key):
+        return self.counters[key]
+
+    def add(self, counters):
+        for key, value in counters.items():
+            if key == 'cutoff_index':
+                for slot, count in enumerate(value):
+                    self.counters[key][slot] += count
+            else:
+                self.counters[key] += value
+
+    def complete_iteration(self, depth):
+        self.depth = depth
+        self.seconds = time.time() - self.start_time
+        self.depth_times.append(self.seconds)
+        self.depth_nodes.append(self.counters['nodes'])
+
+    def finish(self):
+        self.seconds = time.time() - self.start_time
+
+    @property
+    def tt_hit_rate(self):
+        return self.counters['tt_hits'] / self.counters['tt_probes'] if self.counters['tt_probes'] else 0.
+
+    @property
+    def total_nodes(self):
+        # Positions searched, quiescence search included, as max_nodes of ChessGame.search counts them
+        return self.counters['nodes'] + self.counters['qnodes']
+
+    @property
+    def nps(self):
+        return self.total_nodes / self.seconds if self.seconds > 0 else 0.
+
+    def to_dict(self):
+        return dict(self.counters, depth=self.depth, depth_times=self.depth_times, depth_nodes=self.depth_nodes,
+                    book=self.book, seconds=self.seconds, nps=self.nps, tt_hit_rate=self.tt_hit_rate)
+
+    def write(self, stream, event, **fields):
+        """
+        One JSON line on stream: the event name, fields, then the counts so far
+        """
+        stream.write(json.dumps(dict({'event': event}, **fields, **self.to_dict())) + '\n')
+        stream.flush()
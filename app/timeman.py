@@ -0,0 +1,29 @@
+"""
+
+Per-move time allocation from a game clock.
+
+The soft limit is when the search should stop starting new iterations, the
+hard limit is the deadline every worker stops at, whatever it is doing.
+
+"""
+
+
+class TimeManager:
+    """
+    Splits the remaining clock into soft and hard limits for the next move
+    """
+    def __init__(self, moves_to_go=30, increment_share=0.75, hard_ratio=3, max_share=0.5, overhead=0.05):
+        self.moves_to_go = moves_to_go
+        self.increment_share = increment_share
+        self.hard_ratio = hard_ratio
+        self.max_share = max_share
+        self.overhead = overhead
+
+    def allocate(self, remaining, increment=0, moves_to_go=None):
+        """
+        Returns (soft, hard) in seconds for a side with `remaining` seconds left on its clock
+        """
+        remaining = max(0, remaining - self.overhead)
+        soft = remaining / (moves_to_go or self.moves_to_go) + increment * self.increment_share
+        hard = min(soft * self.hard_ratio, remaining * self.max_share)
+        return min(soft, hard), hard
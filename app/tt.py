@@ -0,0 +1,150 @@
+import mmap
+import os
+import tempfile
+import weakref
+from collections import namedtuple
+
+
+"""
+
+Transposition table shared between processes.
+
+The table is a memory mapped file (under /dev/shm when there is one) viewed as
+an array of unsigned 64 bit words, so every pool worker maps the same memory.
+A bucket holds two entries: slot 0 is depth-preferred, slot 1 is always
+replaced. An entry is two words:
+
+    [key ^ data, data]
+
+data = score + 2**31 (bits 0-31) | depth (32-39) | bound (40-41) | move (42-57) | generation (58-63)
+
+Writers never lock. A reader only accepts an entry whose two words XOR back to
+the probed key, so an entry torn by two workers writing at once reads as a miss.
+
+Workers that come after the table attach to it by its path. Once every process
+that is to use the table has it mapped, unlink removes the file, so that the
+memory goes back with the last of them however they end, killed or not.
+
+"""
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+WORD_BYTES = 8
+ENTRY_WORDS = 2
+BUCKET_WORDS = 2 * ENTRY_WORDS
+BUCKET_BYTES = BUCKET_WORDS * WORD_BYTES
+
+PROMOTIONS = ' NBRQ'
+
+_SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+TTEntry = namedtuple('TTEntry', ['depth', 'score', 'bound', 'move'])
+
+# Tables already mapped by this process, by path, so unpickling one per task is cheap
+_attached = {}
+
+
+def encode_move(from_position, to_position, promotion=None):
+    return from_position.square | (to_position.square << 6) | (PROMOTIONS.index(promotion or ' ') << 12)
+
+
+def decode_move(move):
+    # (from square, to square, promotion piece name or None)
+    promotion = PROMOTIONS[move >> 12]
+    return move & 63, (move >> 6) & 63, None if promotion == ' ' else promotion
+
+
+def _unlink(path, owner_pid):
+    # Only the process that created the file removes it, never a forked worker
+    if os.getpid() == owner_pid:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def attach(table):
+    # table is the one tasks naming its path get in this process, for a process that inherits it, see unlink
+    _attached[table.path] = table
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table of search results keyed by Zobrist key
+    """
+    def __init__(self, size_mb=16, path=None):
+        if path is None:
+            n_buckets = 1
+            while n_buckets * 2 * BUCKET_BYTES <= size_mb * 1024 * 1024:
+                n_buckets *= 2
+            fd, path = tempfile.mkstemp(prefix='chess-tt-', dir=_SHM_DIR)
+            os.ftruncate(fd, n_buckets * BUCKET_BYTES)
+            owner_pid = os.getpid()
+        else:
+            fd = os.open(path, os.O_RDWR)
+            owner_pid = None
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+
+        self.path = path
+        self.words = memoryview(self._mmap).cast('Q')
+        self.mask = len(self.words) // BUCKET_WORDS - 1
+        self.generation = 0
+        self._finalizer = weakref.finalize(self, _unlink, path, owner_pid)
+
+    def __getstate__(self):
+        return {'path': self.path, 'generation': self.generation}
+
+    def __setstate__(self, state):
+        attached = _attached.get(state['path'])
+        if attached is None:
+            attached = _attached[state['path']] = TranspositionTable(path=state['path'])
+        self.__dict__.update(attached.__dict__)
+        self.generation = state['generation']
+
+    def close(self):
+        self.words.release()
+        self._mmap.close()
+        self._finalizer()
+
+    def unlink(self):
+        """
+        Removes the file, the table staying mapped. Only processes mapping it already, such as workers forked since
+        it was made, can use it from here on.
+        """
+        self._finalizer()
+
+    def new_search(self):
+        # Entries from earlier searches stay usable but lose their depth-preferred slot
+        self.generation = (self.generation + 1) & 63
+
+    def clear(self):
+        self._mmap[:] = bytes(len(self._mmap))
+
+    def probe(self, key):
+        words = self.words
+        index = (key & self.mask) * BUCKET_WORDS
+        for slot in (index, index + ENTRY_WORDS):
+            data = words[slot + 1]
+            if words[slot] ^ data == key:
+                return TTEntry(depth=(data >> 32) & 0xFF, score=(data & 0xFFFFFFFF) - (1 << 31),
+                               bound=(data >> 40) & 3, move=(data >> 42) & 0xFFFF)
+        return None
+
+    def store(self, key, depth, score, bound, move=0):
+        words = self.words
+        index = (key & self.mask) * BUCKET_WORDS
+        data = ((score + (1 << 31)) & 0xFFFFFFFF) | (min(depth, 255) << 32) | (bound << 40) | (move << 42) | \
+            (self.generation << 58)
+
+        stored = words[index + 1]
+        if words[index] ^ stored == key or depth >= (stored >> 32) & 0xFF or stored >> 58 != self.generation:
+            slot = index
+        else:
+            slot = index + ENTRY_WORDS
+        words[slot] = key ^ data
+        words[slot + 1] = data
@@ -0,0 +1,253 @@
+import argparse
+import sys
+import threading
+from .board import Board
+from .chess import ChessGame, MATE, MAX_PLY
+from .fen import START_FEN
+from .movegen import Move, generate_legal_moves
+from .perft import move_name
+from .rules import is_promotion
+from .timeman import TimeManager
+
+
+"""
+
+UCI front-end, for GUIs and match runners speaking the Universal Chess
+Interface:
+
+    python -m app [--workers N] [--tt-size-mb MB] [--book book.bin]
+
+Commands: uci, isready, setoption (Hash), ucinewgame, position, go (wtime,
+btime, winc, binc, movestogo, movetime, depth, nodes, infinite, ponder),
+stop, ponderhit, quit. A command that cannot be run, an illegal move or a
+missing value, is answered with an info string and otherwise ignored.
+
+A search runs in a thread of its own while commands keep being read, so stop
+and ponderhit act on it at once: stop cuts every pool worker short through
+the shared deadline of ChessGame and the best move of the last completed
+iteration is sent. The ChessGame, with its pool of worker processes and its
+transposition table, lives for the whole session.
+
+"""
+
+NAME = 'chess'
+AUTHOR = 'kunwar31'
+
+INFINITE = float('inf')
+MAX_DEPTH = 64
+
+
+def _root_move(move):
+    # Move of a (piece, to_position) root move, which leaves promotions to the board's default, a queen
+    piece, to_position = move
+    return Move(piece.position, to_position, 'Q' if is_promotion(piece.name, to_position.square) else None)
+
+
+class UCIEngine:
+    def __init__(self, game, output=sys.stdout, time_manager=None):
+        self.game = game
+        self.output = output
+        self.time_manager = time_manager or TimeManager()
+        self.board = Board.from_fen(START_FEN)
+        self._lock = threading.Lock()
+        self._thread = None
+        # Set when bestmove may be sent: at once, or not before stop / ponderhit for go infinite and go ponder
+        self._release = threading.Event()
+        # (soft, hard) seconds the search gets once a ponder search turns into a real one
+        self._ponder_time = None
+        # Move of the last info line sent by the running search
+        self._pv = None
+
+    def send(self, line):
+        with self._lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line):
+        """
+        Runs one command line, returns False on quit. A command that fails is reported as an info string and
+        otherwise ignored, the engine reading on.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        try:
+            return self._run(command, args)
+        except Exception as error:
+            self.send(f'info string error in {line.strip()!r}: {type(error).__name__}: {error}')
+            return True
+
+    def _run(self, command, args):
+        if command == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            self.send('option name Hash type spin default 16 min 1 max 4096')
+            self.send('option name Ponder type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self._set_option(args)
+        elif command == 'ucinewgame':
+            self.wait()
+            self.game.cache.clear()
+            self.board = Board.from_fen(START_FEN)
+        elif command == 'position':
+            self.wait()
+            self.board = self._position(args)
+        elif command == 'go':
+            self.wait()
+            self._go(args)
+        elif command == 'stop':
+            self.stop()
+        elif command == 'ponderhit':
+            self._ponderhit()
+        elif command == 'quit':
+            self.stop()
+            return False
+        return True
+
+    def _set_option(self, args):
+        text = ' '.join(args)
+        name, _, value = text.partition(' value ')
+        name = name.replace('name', '', 1).strip().lower()
+        if name == 'hash':
+            self.wait()
+            self.game.set_table_size(int(value))
+
+    @staticmethod
+    def _position(args):
+        if args and args[0] == 'startpos':
+            fen, rest = START_FEN, args[1:]
+        elif args and args[0] == 'fen':
+            fen, rest = ' '.join(args[1:7]), args[7:]
+        else:
+            raise ValueError(f"Unknown position {' '.join(args)}")
+
+        board = Board.from_fen(fen)
+        if rest and rest[0] == 'moves':
+            for name in rest[1:]:
+                move = next((move for move in generate_legal_moves(board) if move_name(move) == name), None)
+                if move is None:
+                    raise ValueError(f'Illegal move {name} in {board.to_fen()}')
+                board.move_piece(*move)
+        return board
+
+    def _go(self, args):
+        options = {}
+        flags = set()
+        index = 0
+        while index < len(args):
+            if args[index] in ('infinite', 'ponder'):
+                flags.add(args[index])
+                index += 1
+            elif args[index] == 'searchmoves':
+                break
+            elif index + 1 < len(args):
+                options[args[index]] = float(args[index + 1])
+                index += 2
+            else:
+                raise ValueError(f'No value for {args[index]}')
+
+        color = self.board.side_to_move
+        remaining = options.get('wtime' if color == 'W' else 'btime')
+        if 'movetime' in options:
+            soft_time = hard_time = options['movetime'] / 1000
+        elif remaining is not None:
+            increment = options.get('winc' if color == 'W' else 'binc', 0) / 1000
+            moves_to_go = int(options['movestogo']) if 'movestogo' in options else None
+            soft_time, hard_time = self.time_manager.allocate(remaining / 1000, increment, moves_to_go)
+        else:
+            soft_time = hard_time = INFINITE
+
+        # Pondering searches without a limit until ponderhit starts the clock
+        if 'ponder' in flags:
+            self._ponder_time = soft_time, hard_time
+            soft_time = hard_time = INFINITE
+        else:
+            self._ponder_time = None
+        if flags:
+            self._release.clear()
+        else:
+            self._release.set()
+
+        self.game.set_time(soft_time, hard_time)
+        max_depth = int(options.get('depth', MAX_DEPTH))
+        max_nodes = int(options['nodes']) if 'nodes' in options else None
+        self._thread = threading.Thread(target=self._search, args=(self.board.copy(), max_depth, max_nodes),
+                                        daemon=True)
+        self._thread.start()
+
+    def _search(self, board, max_depth, max_nodes):
+        self._pv = None
+        result = self.game.search(board, board.side_to_move, None, max_depth, 1, max_nodes=max_nodes,
+                                  on_iteration=self._info)
+        # A search out of depth or nodes while pondering or infinite still waits for its stop or ponderhit
+        self._release.wait()
+
+        if result.move[0] is None:
+            self.send('bestmove 0000')
+            return
+        # The search picks at random among equally good moves, and book moves have no info line at all: the GUI
+        # gets the move played in the last one
+        if result.move != self._pv:
+            self._info(result.stats.depth, result.move, result.score, result.stats)
+        move = _root_move(result.move)
+        # The reply the search expects, to ponder on
+        board.make_move(*move)
+        ponder = self.game.expected_reply(board)
+        self.send(f'bestmove {move_name(move)}' + (f' ponder {move_name(ponder)}' if ponder is not None else ''))
+
+    def _info(self, depth, best_move, score, stats):
+        self._pv = best_move
+        if abs(score) >= MATE - MAX_PLY:
+            # Mate scores fall short of MATE by the plies to the mate
+            moves = (MATE - abs(score) + 1) // 2
+            score_text = f'mate {moves if score > 0 else -moves}'
+        else:
+            score_text = f'cp {score}'
+        nodes = stats.total_nodes
+        self.send(f"info depth {depth} score {score_text} nodes {nodes} nps {int(nodes / max(stats.seconds, 1e-6))} "
+                  f"time {int(stats.seconds * 1000)} pv {move_name(_root_move(best_move))}")
+
+    def _ponderhit(self):
+        if self._ponder_time is not None:
+            # The clock starts now, with the time the move would have had anyway
+            self.game.set_time(*self._ponder_time)
+            self._ponder_time = None
+        self._release.set()
+
+    def stop(self):
+        if self._thread is not None:
+            self.game.stop()
+            self._release.set()
+            self._thread.join()
+            self._thread = None
+
+    def wait(self):
+        # Lets a search that is not pondering or infinite run to its own end
+        if self._thread is not None:
+            if not self._release.is_set():
+                self.stop()
+            self._thread.join()
+            self._thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app', description='UCI chess engine')
+    parser.add_argument('--workers', type=int, default=None, help='search pool size')
+    parser.add_argument('--tt-size-mb', type=int, default=16)
+    parser.add_argument('--book', help='opening book of app.book')
+    args = parser.parse_args(argv)
+
+    game = ChessGame(Board(snapshots=False), tt_size_mb=args.tt_size_mb, workers=args.workers, book=args.book)
+    engine = UCIEngine(game)
+    try:
+        for line in sys.stdin:
+            if not engine.handle(line):
+                break
+    finally:
+        engine.stop()
+        game.close()
+    return 0
@@ -0,0 +1,48 @@
+import random
+
+
+"""
+
+Zobrist keys: a board's key is the XOR of one random 64 bit number per
+(color, piece, square), plus one for black to move, one per castling right
+and one for the file of the en-passant square.
+
+The numbers come from a fixed seed, so every process derives the same key for
+the same position and keys can be shared between pool workers.
+
+"""
+
+_random = random.Random(0x5A0B1257)
+
+PIECE_KEYS = {
+    color: {name: [_random.getrandbits(64) for _ in range(64)] for name in 'PNBRQK'}
+    for color in 'WB'
+}
+SIDE_KEY = _random.getrandbits(64)
+CASTLING_KEYS = {right: _random.getrandbits(64) for right in 'KQkq'}
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+
+
+def castling_key(castling_rights):
+    key = 0
+    for right in castling_rights:
+        key ^= CASTLING_KEYS[right]
+    return key
+
+
+def en_passant_key(en_passant):
+    if en_passant is None:
+        return 0
+    return EN_PASSANT_KEYS[en_passant.file - 1]
+
+
+def compute_key(pieces, side_to_move, castling_rights, en_passant):
+    """
+    Key from scratch, pieces being an iterable of (color, name, square)
+    """
+    key = 0
+    for color, name, square in pieces:
+        key ^= PIECE_KEYS[color][name][square]
+    if side_to_move == 'B':
+        key ^= SIDE_KEY
+    return key ^ castling_key(castling_rights) ^ en_passant_key(en_passant)